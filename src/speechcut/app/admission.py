@@ -0,0 +1,121 @@
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+from speechcut.audio.processor import AudioProcessor
+from speechcut.config.settings import settings
+
+log = logging.getLogger('speechcut.admission')
+
+# Rough per-second costs of the transient (per-job) memory; resident models are not counted.
+FLOAT32 = 4
+YAMNET_BYTES_PER_SECOND = 1024 * 1024       # log-mel patches + peak MobileNet activations
+FFMPEG_BASE_BYTES = 64 * 1024 * 1024        # codec/filter graph overhead per render
+
+@dataclass
+class JobPlan:
+  path: Path
+  duration: float
+  estimated_bytes: int
+  low_memory: bool
+  live: bool = False
+
+def estimate_job_bytes(
+  duration: float,
+  source_sr: int,
+  source_ch: int,
+  processing_sr: int = settings.PROCESSING_SR,
+  chunk_seconds: float | None = None,
+  yamnet_window_seconds: float = settings.LOW_MEMORY_CHUNK_SECONDS,
+) -> int:
+  '''
+  Estimate the peak transient memory of one job.
+    - decoded float32 waveform at `processing_sr` (+ one working copy for segment slices)
+    - YAMNet activations for one inference call: segments are fed to YAMNet in windows of at most
+      `yamnet_window_seconds` (see `SpeechExtractor.classify_segment`), so this term does not grow
+      with the file
+    - ffmpeg render: with a single input, the split/atrim graph can buffer the whole decode
+      at the source rate; the low-memory render seeks per segment and only needs the base overhead
+  '''
+  held = min(duration, chunk_seconds) if chunk_seconds else duration
+  waveform = held * processing_sr * FLOAT32 * 2
+  yamnet = min(held, yamnet_window_seconds) * YAMNET_BYTES_PER_SECOND
+  render = FFMPEG_BASE_BYTES + (0 if chunk_seconds else duration * source_sr * source_ch * FLOAT32)
+  return int(waveform + yamnet + render)
+
+def plan_job(
+  path: Path,
+  ceiling: int = settings.MEMORY_BUDGET_BYTES,
+  chunk_seconds: float = settings.LOW_MEMORY_CHUNK_SECONDS,
+  live: bool = False,
+) -> JobPlan:
+  '''
+  Probe `path` and decide whether it runs in full or in the chunked low-memory mode.
+  The decision rests on the memory estimate alone (compressed file size says little about the
+  decoded size). Live (still growing) files are always tailed in chunks and are not probed:
+  a recording that was just created often has no readable header or duration yet, and the chunked
+  estimate does not depend on the source format. Their `duration` is 0 (unknown).
+  '''
+  if live:
+    chunked = estimate_job_bytes(chunk_seconds, settings.OUTPUT_SR, settings.OUTPUT_CH, chunk_seconds=chunk_seconds)
+    return JobPlan(path, 0.0, chunked, low_memory=True, live=True)
+
+  info = AudioProcessor(path).get_audio_info()
+  duration = float(info['duration'])
+  source_sr = int(info.get('sample_rate') or settings.OUTPUT_SR)
+  source_ch = int(info.get('channels') or settings.OUTPUT_CH)
+
+  full = estimate_job_bytes(duration, source_sr, source_ch)
+  if full <= ceiling:
+    return JobPlan(path, duration, full, low_memory=False)
+
+  chunked = estimate_job_bytes(duration, source_sr, source_ch, chunk_seconds=chunk_seconds)
+  log.info(f'[admission] {path.name}: ~{full / 2**20:.0f}MB in full, using low-memory path (~{chunked / 2**20:.0f}MB)')
+  return JobPlan(path, duration, chunked, low_memory=True)
+
+class MemoryBudget:
+  '''
+  Tracks the estimated memory of running jobs against a ceiling (shared by all worker threads).
+  A job that does not fit waits until running jobs release their share;
+  a job is always admitted when no other job is running, so an oversized estimate cannot stall the queue.
+  Non-job reservations (string keys, e.g. a standby worker's models) count towards `used` but never
+  block that rule: a standby is only promoted by the next job, so it must not keep that job out.
+  '''
+
+  def __init__(self, ceiling: int = settings.MEMORY_BUDGET_BYTES):
+    self.ceiling = ceiling
+    self._reserved: dict[str, int] = {}
+    self._jobs: set[str] = set()
+    self._lock = Lock()
+
+  @property
+  def used(self) -> int:
+    with self._lock:
+      return sum(self._reserved.values())
+
+  @staticmethod
+  def _key(path: Path | str) -> str:
+    # plain strings name non-job reservations (e.g. a standby worker's models)
+    return str(path.resolve()) if isinstance(path, Path) else path
+
+  def try_acquire(self, path: Path | str, nbytes: int) -> bool:
+    '''Reserve `nbytes` for `path` if it fits the remaining budget.'''
+    key = self._key(path)
+    is_job = isinstance(path, Path)
+    with self._lock:
+      used = sum(self._reserved.values())
+      blocking = self._jobs if is_job else self._reserved
+      if blocking and used + nbytes > self.ceiling:
+        return False
+      self._reserved[key] = nbytes
+      if is_job:
+        self._jobs.add(key)
+      return True
+
+  def release(self, path: Path | str) -> None:
+    key = self._key(path)
+    with self._lock:
+      self._reserved.pop(key, None)
+      self._jobs.discard(key)
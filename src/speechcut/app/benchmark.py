@@ -0,0 +1,94 @@
+'''
+Measure aggregate throughput for different worker x thread layouts.
+
+  python -m speechcut.app.benchmark a.mp3 b.mp3 c.mp3 --layouts 1x8 2x4 4x2 --pin
+
+Each layout starts its workers, waits until the models are loaded, then processes every file
+once (outputs are written as in normal operation) and reports audio seconds processed per wall second.
+'''
+from __future__ import annotations
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from speechcut.app.manager import Supervisor
+from speechcut.audio.processor import AudioProcessor
+from speechcut.config.settings import settings
+from speechcut.utils.threads import plan_cpu_sets
+
+log = logging.getLogger('speechcut.benchmark')
+
+def _parse_layout(text: str) -> tuple[int, int]:
+  workers, _, threads = text.lower().partition('x')
+  return int(workers), int(threads or 0)
+
+def run_layout(files: list[Path], workers: int, threads: int, pin: bool, timeout: int) -> dict:
+  layout = plan_cpu_sets(workers, threads)
+  managers = [Supervisor(default_timeout=timeout, threads=t, cpus=cpus, pin=pin) for cpus, t in layout]
+  try:
+    t0 = time.perf_counter()
+    ready = [m.warm_up() for m in managers]
+    load_sec = time.perf_counter() - t0
+    if not all(ready):
+      raise RuntimeError('worker failed to load models')
+
+    todo: queue.Queue[Path] = queue.Queue()
+    for f in files:
+      todo.put(f)
+    statuses: list[str] = []
+
+    def drain(manager: Supervisor):
+      while True:
+        try:
+          f = todo.get_nowait()
+        except queue.Empty:
+          return
+        statuses.append(manager.process(str(f)))
+
+    t0 = time.perf_counter()
+    threads_ = [threading.Thread(target=drain, args=(m,)) for m in managers]
+    for t in threads_:
+      t.start()
+    for t in threads_:
+      t.join()
+    wall = time.perf_counter() - t0
+  finally:
+    for m in managers:
+      m.shutdown()
+
+  audio_sec = sum(float(AudioProcessor(f).get_audio_info()['duration']) for f in files)
+  return {
+    'layout': f'{workers}x{layout[0][1]}',
+    'load_seconds': load_sec,
+    'wall_seconds': wall,
+    'audio_seconds': audio_sec,
+    'realtime_factor': audio_sec / wall if wall else 0.0,
+    'failed': sum(s != 'ok' for s in statuses),
+  }
+
+def main():
+  p = argparse.ArgumentParser(prog='speechcut-benchmark', description=__doc__.strip().splitlines()[0])
+  p.add_argument('files', nargs='+', type=Path)
+  p.add_argument('--layouts', nargs='+', default=['1x0'], help='WORKERSxTHREADS, e.g. 2x4 (threads 0 = CPUs / workers)')
+  p.add_argument('--pin', action='store_true', help='pin each worker to its CPU set')
+  p.add_argument('--timeout', type=int, default=3600)
+  args = p.parse_args()
+
+  os.environ['PATH'] = str(settings.FFMPEG_BIN.parent) + os.pathsep + os.environ.get('PATH', '')
+  logging.basicConfig(level=logging.WARNING)
+  print(f"{'layout':<8} {'load_s':>8} {'wall_s':>9} {'audio_s':>9} {'x_realtime':>10} {'failed':>6}")
+  for text in args.layouts:
+    workers, threads = _parse_layout(text)
+    r = run_layout(args.files, workers, threads, args.pin, args.timeout)
+    print(f"{r['layout']:<8} {r['load_seconds']:>8.1f} {r['wall_seconds']:>9.1f} "
+          f"{r['audio_seconds']:>9.1f} {r['realtime_factor']:>10.1f} {r['failed']:>6}")
+
+if __name__ == '__main__':
+  mp.freeze_support()
+  mp.set_start_method('spawn', force=True)
+  main()
@@ -1,7 +1,17 @@
 import logging
+import os
 import queue
+import signal
+import threading
+import time
 import multiprocessing as mp
+from pathlib import Path
+from speechcut.config.settings import settings
+from speechcut.app.admission import MemoryBudget
+from speechcut.app.metrics import metrics
+from speechcut.utils.proc import child_pids
 from speechcut.app.worker import WorkerProcess
+from speechcut.utils.threads import thread_env
 
 log = logging.getLogger('speechcut.manager')
 AUDIO_EXTS = {'.wav', '.mp3', '.flac'}
@@ -13,33 +23,184 @@ class Supervisor:
     * Enqueue the task and wait on `result_queue` for the response with the matching `task_id` within the timeout.
     * If a timeout occurs, forcibly terminate the worker and recreate the queues/worker (a fresh worker will start on the next call).
     * If processing completes successfully, keep the worker alive for reuse.
+  - `threads`/`cpus`/`pin` set the worker's thread budget and CPU set (see `utils.threads`),
+    so that several supervisors do not oversubscribe the machine.
+  - Results, model load times and worker RSS from the worker are recorded in `app.metrics`
+    under the `worker=<worker_id>` label.
+  - Recycling: once the worker has completed `max_tasks` tasks or reported an RSS of at least
+    `max_rss_bytes`, a standby worker is started with its own queues. The old worker keeps serving
+    tasks until the standby reports `ready`; the swap then happens between tasks and the old worker
+    is shut down gracefully, so no task waits on a model load.
+    With a `budget`, the standby's models (the RSS the current worker reported when it became ready)
+    are reserved in it until the swap, and the standby is not started while that does not fit.
   '''
-  def __init__(self, default_timeout: int = 600, log_queue=None):
+  def __init__(self, default_timeout: int = 600, log_queue=None,
+               threads: int = 0, cpus: list[int] | None = None, pin: bool = False, worker_id: int = 0,
+               max_tasks: int = settings.WORKER_MAX_TASKS,
+               max_rss_bytes: int = settings.WORKER_MAX_RSS_MB * 1024 * 1024,
+               budget: MemoryBudget | None = None):
     self.ctx = mp.get_context('spawn')
+    self.worker_id = worker_id
+    self.max_tasks = max_tasks
+    self.max_rss_bytes = max_rss_bytes
+    self.budget = budget
+    self._workers_started = 0
+    self._tasks_done = 0
+    self._recycle_due = False
+    self._model_bytes = 0
+    self._standby = None  # (worker, task_queue, result_queue) while a replacement is loading
+    self._standby_key = f'standby-worker-{worker_id}'
     self.default_timeout = default_timeout
     self.log_queue = log_queue
+    self.threads = threads
+    self.cpus = cpus
+    self.pin = pin
     self._make_queues()
     self.worker = None
     self._task_seq = 0
+    self.current_path: str | None = None  # job in progress, for `abort`
+    self._abort = threading.Event()
 
   def _make_queues(self):
     self.task_queue = self.ctx.Queue()
     self.result_queue = self.ctx.Queue()
 
+  def _new_worker(self, task_queue, result_queue) -> WorkerProcess:
+    worker = WorkerProcess(
+      task_queue, result_queue, log_queue=self.log_queue,
+      threads=self.threads, cpus=self.cpus, pin=self.pin,
+    )
+    worker.daemon = False  # On Windows, it’s recommended to explicitly set `daemon=False`.
+    with thread_env(self.threads):  # the child loads numpy/BLAS before WorkerProcess.run()
+      worker.start()
+    log.info(f'[manager] worker started pid={worker.pid}')
+    if self._workers_started:
+      metrics.inc('speechcut_worker_restarts_total', worker=self.worker_id)
+    self._workers_started += 1
+    return worker
+
   def _start_worker_if_needed(self):
     if self.worker is None or not self.worker.is_alive():
+      if self._standby is not None:
+        # the replacement is already loading (or loaded); use it instead of starting another
+        self._promote_standby()
+        return
       log.info('[manager] starting worker...')
-      self.worker = WorkerProcess(self.task_queue, self.result_queue, log_queue=self.log_queue)
-      self.worker.daemon = False  # On Windows, it’s recommended to explicitly set `daemon=False`.
-      self.worker.start()
-      log.info(f'[manager] worker started pid={self.worker.pid}')
+      self.worker = self._new_worker(self.task_queue, self.result_queue)
+      self._tasks_done = 0
+      self._recycle_due = False
+
+  def _after_task(self, msg: dict):
+    '''Count the completed task and start a standby worker once a recycling limit is reached.'''
+    self._tasks_done += 1
+    rss = msg.get('rss') or 0
+    over_tasks = self.max_tasks and self._tasks_done >= self.max_tasks
+    over_rss = self.max_rss_bytes and rss >= self.max_rss_bytes
+    if (over_tasks or over_rss) and not self._recycle_due:
+      log.info(f'[manager] recycle pid={self.worker.pid}: tasks={self._tasks_done} rss={rss / 2**20:.0f}MB')
+      self._recycle_due = True
+    self._start_standby_if_due()
+
+  def _start_standby_if_due(self):
+    '''Start the standby once its models fit the memory budget; otherwise retry after the next task.'''
+    if not self._recycle_due or self._standby is not None:
+      return
+    if self.budget is not None and not self.budget.try_acquire(self._standby_key, self._model_bytes):
+      log.info(f'[manager] standby deferred: ~{self._model_bytes / 2**20:.0f}MB does not fit '
+               f'({self.budget.used / 2**20:.0f}/{self.budget.ceiling / 2**20:.0f}MB in use)')
+      return
+    log.info('[manager] starting standby worker')
+    task_queue, result_queue = self.ctx.Queue(), self.ctx.Queue()
+    self._standby = (self._new_worker(task_queue, result_queue), task_queue, result_queue)
+
+  def _drop_standby(self, grace: float = 10):
+    self._stop_worker(*self._standby, grace=grace)
+    self._standby = None
+    if self.budget is not None:
+      self.budget.release(self._standby_key)
+
+  def _swap_if_standby_ready(self):
+    '''Between tasks: switch to the standby worker once its models are loaded.'''
+    self._start_standby_if_due()
+    if self._standby is None:
+      return
+    worker, _, result_queue = self._standby
+    try:
+      msg = result_queue.get_nowait()
+    except queue.Empty:
+      if not worker.is_alive():
+        log.error(f'[manager] standby worker pid={worker.pid} exited before becoming ready')
+        self._drop_standby()
+      return
+    if msg.get('type') == 'ready':
+      self._on_ready(msg)
+      # a planned swap only if the current worker is still serving (not killed on timeout/error)
+      self._promote_standby(recycle=self.worker is not None and self.worker.is_alive())
+    else:
+      log.error(f'[manager] standby worker failed: {msg}')
+      self._drop_standby()
+
+  def _promote_standby(self, recycle: bool = False):
+    '''
+    Make the standby the current worker. `recycle` marks a planned swap from a live worker;
+    replacing a worker that crashed or was killed on timeout is not counted as a recycle.
+    '''
+    old = (self.worker, self.task_queue, self.result_queue)
+    self.worker, self.task_queue, self.result_queue = self._standby
+    self._standby = None
+    self._tasks_done = 0
+    self._recycle_due = False
+    if self.budget is not None:
+      # the old worker's models are freed below, so the standby's reservation is no longer extra
+      self.budget.release(self._standby_key)
+    if recycle:
+      metrics.inc('speechcut_worker_recycles_total', worker=self.worker_id)
+    log.info(f'[manager] switched to worker pid={self.worker.pid}')
+    self._stop_worker(*old)
+
+  def _stop_worker(self, worker, task_queue, result_queue, grace: float = 10):
+    '''Ask an idle worker to exit, terminating it if it does not within `grace` seconds.'''
+    if worker is not None and worker.is_alive():
+      task_queue.put({'type': 'shutdown'})
+      worker.join(grace)
+      if worker.is_alive():
+        worker.terminate()
+        worker.join(5)
+    try:
+      task_queue.close()
+      result_queue.close()
+    except Exception:
+      pass
+
+  def _on_ready(self, msg: dict):
+    self._model_bytes = msg.get('rss') or self._model_bytes
+    metrics.set('speechcut_model_load_seconds', msg.get('load_seconds', 0.0), worker=self.worker_id)
+
+  def _record(self, status: str, started: float, msg: dict | None = None):
+    msg = msg or {}
+    metrics.inc('speechcut_jobs_total', status=status)
+    metrics.observe('speechcut_job_seconds', time.monotonic() - started)
+    if status == 'ok':
+      metrics.inc('speechcut_audio_seconds_total', msg.get('audio_seconds', 0.0))
+      for stage, sec in (msg.get('stages') or {}).items():
+        metrics.observe('speechcut_stage_seconds', sec, stage=stage)
+    if msg.get('rss'):
+      metrics.set('speechcut_worker_rss_bytes', msg['rss'], worker=self.worker_id)
 
   def _kill_worker(self):
     if self.worker and self.worker.is_alive():
       log.warning(f'[manager] terminating worker pid={self.worker.pid}')
+      # ffmpeg started by the worker would otherwise keep running (and writing) after it is gone;
+      # list them first, terminated children are re-parented and cannot be found afterwards
+      children = child_pids(self.worker.pid)
       self.worker.terminate()
       self.worker.join(5)
-      log.info('[manager] worker terminated')
+      for pid in children:
+        try:
+          os.kill(pid, signal.SIGTERM)
+        except OSError:
+          pass
+      log.info(f'[manager] worker terminated (and {len(children)} child process(es))')
     self.worker = None
     # Also recreate the queues cleanly (to prevent zombie/stale messages).
     try:
@@ -49,42 +210,108 @@ class Supervisor:
       pass
     self._make_queues()
 
-  def process(self, audio_path: str, timeout: int | None = None) -> str:
+  def warm_up(self, timeout: int | None = None) -> bool:
+    '''Start the worker and wait until its models are loaded.'''
+    self._start_worker_if_needed()
+    deadline = time.monotonic() + (timeout or self.default_timeout)
+    try:
+      while True:
+        msg = self.result_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+        if msg.get('type') == 'ready':
+          self._on_ready(msg)
+          return True
+        if msg.get('type') == 'fatal':
+          log.error(msg)
+          self._kill_worker()
+          return False
+    except queue.Empty:
+      return False
+
+  def abort(self, audio_path) -> None:
+    '''
+    Stop the job for `audio_path` if it is the one in progress (called from another thread, e.g.
+    when its lease was lost). The worker and its ffmpeg are killed, so no output is renamed into
+    place, and `process` returns `'aborted'`.
+    '''
+    current = self.current_path
+    if current is not None and Path(current).resolve() == Path(audio_path).resolve():
+      log.warning(f'[manager] aborting {audio_path}')
+      self._abort.set()
+
+  def process(self, audio_path: str, timeout: int | None = None, low_memory: bool = False, live: bool = False) -> str:
     '''
-    Return value: `'ok' | 'timeout' | 'error'`.
+    Return value: `'ok' | 'timeout' | 'error' | 'aborted'` (see `abort`).
+    `low_memory=True` runs the job in chunks (see `SpeechExtractor.chunked_classification`).
+    `live=True` tails a file that is still being written; each `progress` message from the worker
+    restarts the timeout, so it bounds the time without progress rather than the whole job.
     '''
+    self._swap_if_standby_ready()
     self._start_worker_if_needed()
     self._task_seq += 1
     task_id = self._task_seq
+    self._abort.clear()
+    self.current_path = str(audio_path)
 
-    self.task_queue.put({'type': 'process', 'id': task_id, 'path': str(audio_path)})
+    self.task_queue.put({
+      'type': 'process', 'id': task_id, 'path': str(audio_path),
+      'low_memory': low_memory, 'live': live,
+    })
 
     to = timeout or self.default_timeout
+    started = time.monotonic()
+    deadline = started + to
     try:
       while True:
-        msg = self.result_queue.get(timeout=to)
+        if self._abort.is_set():
+          self._kill_worker()
+          self._record('aborted', started)
+          return 'aborted'
+        try:
+          # short waits so that `abort` is noticed promptly
+          msg = self.result_queue.get(timeout=max(0.0, min(1.0, deadline - time.monotonic())))
+        except queue.Empty:
+          if time.monotonic() >= deadline:
+            raise
+          continue
         mtype = msg.get('type')
+        if mtype == 'ready':
+          self._on_ready(msg)
+          continue
+        if mtype == 'progress':
+          if msg.get('id') == task_id:
+            deadline = time.monotonic() + to
+          continue
+
         if mtype == 'fatal':
           log.error('fatal error ocurred')
           log.error(msg)
           self._kill_worker()
+          self._record('error', started, msg)
           return 'error'
 
         if mtype in ('done', 'error'):
           if msg.get('id') != task_id:
             continue
           if mtype == 'done':
+            self._record('ok', started, msg)
+            self._after_task(msg)
             return 'ok'
           else:
             log.error(msg)
             self._kill_worker()
+            self._record('error', started, msg)
             return 'error'
     except queue.Empty:
       self._kill_worker()
+      self._record('timeout', started)
       return 'timeout'
+    finally:
+      self.current_path = None
     
   def shutdown(self):
     '''Attempt to gracefully shut down the worker when the program exits.'''
+    if self._standby is not None:
+      self._drop_standby(grace=3)
     try:
       if self.worker and self.worker.is_alive():
         self.task_queue.put({'type': 'shutdown'})
@@ -0,0 +1,107 @@
+from __future__ import annotations
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger('speechcut.metrics')
+
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# name -> (type, help)
+METRICS: dict[str, tuple[str, str]] = {
+  'speechcut_jobs_pending': ('gauge', 'Unprocessed files found by the last scan and not yet dispatched.'),
+  'speechcut_jobs_running': ('gauge', 'Jobs currently running on a worker.'),
+  'speechcut_jobs_total': ('counter', 'Finished jobs by status (ok, timeout, error, aborted).'),
+  'speechcut_audio_seconds_total': ('counter', 'Duration of successfully processed audio.'),
+  'speechcut_job_seconds': ('histogram', 'Wall time per job, as seen by the supervisor.'),
+  'speechcut_stage_seconds': ('histogram', 'Wall time per SpeechExtractor stage.'),
+  'speechcut_worker_restarts_total': ('counter', 'Worker processes started after the first one (after timeouts, errors or recycling).'),
+  'speechcut_worker_recycles_total': ('counter', 'Graceful swaps to a standby worker after a task-count or RSS limit.'),
+  'speechcut_model_load_seconds': ('gauge', 'Model load time of the current worker process.'),
+  'speechcut_worker_rss_bytes': ('gauge', 'Resident set size of the worker, reported after each job.'),
+  'speechcut_memory_reserved_bytes': ('gauge', 'Estimated memory reserved by running jobs (admission control).'),
+}
+
+def _key(labels: dict) -> tuple:
+  return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _fmt_labels(key: tuple, extra: tuple = ()) -> str:
+  items = key + extra
+  if not items:
+    return ''
+  body = ','.join(f'{k}="{v}"' for k, v in items)
+  return '{' + body + '}'
+
+class Metrics:
+  '''
+  Minimal thread-safe metrics registry rendered in the Prometheus text exposition format.
+  Only the names declared in `METRICS` are accepted.
+  '''
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._values: dict[str, dict[tuple, float]] = {name: {} for name in METRICS}
+    self._hist: dict[str, dict[tuple, list]] = {name: {} for name, (t, _) in METRICS.items() if t == 'histogram'}
+
+  def inc(self, name: str, value: float = 1.0, **labels) -> None:
+    with self._lock:
+      series = self._values[name]
+      k = _key(labels)
+      series[k] = series.get(k, 0.0) + value
+
+  def set(self, name: str, value: float, **labels) -> None:
+    with self._lock:
+      self._values[name][_key(labels)] = float(value)
+
+  def observe(self, name: str, value: float, **labels) -> None:
+    with self._lock:
+      # [cumulative bucket counts, sum, count]
+      h = self._hist[name].setdefault(_key(labels), [[0] * len(STAGE_BUCKETS), 0.0, 0])
+      for i, b in enumerate(STAGE_BUCKETS):
+        if value <= b:
+          h[0][i] += 1
+      h[1] += value
+      h[2] += 1
+
+  def render(self) -> str:
+    lines = []
+    with self._lock:
+      for name, (mtype, help_) in METRICS.items():
+        lines.append(f'# HELP {name} {help_}')
+        lines.append(f'# TYPE {name} {mtype}')
+        if mtype == 'histogram':
+          for k, (counts, total, n) in self._hist[name].items():
+            for b, c in zip(STAGE_BUCKETS, counts):
+              lines.append(f'{name}_bucket{_fmt_labels(k, (("le", str(b)),))} {c}')
+            lines.append(f'{name}_bucket{_fmt_labels(k, (("le", "+Inf"),))} {n}')
+            lines.append(f'{name}_sum{_fmt_labels(k)} {total}')
+            lines.append(f'{name}_count{_fmt_labels(k)} {n}')
+        else:
+          for k, v in self._values[name].items():
+            lines.append(f'{name}{_fmt_labels(k)} {v}')
+    return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class _Handler(BaseHTTPRequestHandler):
+  def do_GET(self):
+    if self.path.split('?')[0] != '/metrics':
+      self.send_error(404)
+      return
+    body = metrics.render().encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    log.debug(format % args)
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+  '''Serve `/metrics` from a daemon thread. Call `.shutdown()` on the returned server to stop.'''
+  server = ThreadingHTTPServer((host, port), _Handler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+  log.info(f'[metrics] serving http://{host}:{port}/metrics')
+  return server
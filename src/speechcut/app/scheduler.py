@@ -1,11 +1,17 @@
 from __future__ import annotations
 import time
+import queue
 import logging
+import threading
 from pathlib import Path
 from datetime import datetime, timedelta
 from speechcut.config.settings import settings
+from speechcut.app.admission import JobPlan, MemoryBudget, plan_job
 from speechcut.app.manager import Supervisor
-from speechcut.utils.locking import ProcessingLock
+from speechcut.app.metrics import metrics, start_metrics_server
+from speechcut.utils.locking import LeaseLock, ProcessingLock
+from speechcut.utils.proc import rss_bytes
+from speechcut.utils.threads import plan_cpu_sets
 
 log = logging.getLogger('speechcut.scheduler')
 AUDIO_EXTS = {'.wav', '.mp3', '.flac'}
@@ -15,6 +21,8 @@ def _marker_paths(src: Path) -> dict[str, Path]:
     'success': src.with_stem(f'{src.stem}_speech_only'),
     'timeout': src.with_name(f'{src.stem}_speech_only.timeout'),
     'failed':  src.with_name(f'{src.stem}_speech_only.failed'),
+    # outputs live under OUTPUT_DIR when OUTPUT_TARGETS is set, so completion is marked next to the source
+    'done':    src.with_name(f'{src.stem}_speech_only.done'),
   }
 
 def _mark(src: Path, kind: str, note: str = ''):
@@ -25,6 +33,13 @@ def _mark(src: Path, kind: str, note: str = ''):
     content += f'\n{note}'
   mp.write_text(content, encoding='utf-8')
 
+def _is_finished(src: Path) -> bool:
+  marks = _marker_paths(src)
+  if marks['success'].exists() or marks['done'].exists():
+    return True
+  # no retry on failure
+  return marks['timeout'].exists() or marks['failed'].exists()
+
 def get_unprocessed_audio_files(beginning: datetime) -> list[Path]:
   input_dirs = settings.INPUT_DIR
   now = datetime.now()
@@ -41,66 +56,151 @@ def get_unprocessed_audio_files(beginning: datetime) -> list[Path]:
       if datetime.fromtimestamp(file.stat().st_mtime) < cutoff:
         continue
 
-      marks = _marker_paths(file)
-
-      if marks['success'].exists():
-        continue
-      # no retry on failure
-      if marks['timeout'].exists() or marks['failed'].exists():
+      if _is_finished(file):
         continue
       
       targets.append(file)
 
   return sorted(targets, key=lambda p: p.stat().st_mtime)
 
-def process_file(audio_path: Path, locker: ProcessingLock, manager: Supervisor, timeout_sec: int = 600):
-  if locker.is_locked(audio_path):
-    log.info(f'[skip] Already processing: {audio_path.name}')
-    return
-
-  log.info(f'[process] {audio_path.name}')
-  locker.lock(audio_path)
+def _is_live(file: Path) -> bool:
+  '''A file modified within LIVE_IDLE_SECONDS is assumed to be still recording.'''
+  return settings.LIVE_MODE and time.time() - file.stat().st_mtime < settings.LIVE_IDLE_SECONDS
+
+def process_file(audio_path: Path, manager: Supervisor, timeout_sec: int = 600, low_memory: bool = False, live: bool = False):
+  mode = ' (live)' if live else ' (low-memory)' if low_memory else ''
+  log.info(f'[process] {audio_path.name}{mode}')
+  status = manager.process(str(audio_path), timeout=timeout_sec, low_memory=low_memory, live=live)
+  # a retry runs on a fresh worker and resumes from the job's stage checkpoints
+  for attempt in range(settings.JOB_RETRIES):
+    if status in ('ok', 'aborted'):
+      break
+    log.warning(f'[retry {attempt + 1}/{settings.JOB_RETRIES}] {audio_path.name} after {status}')
+    status = manager.process(str(audio_path), timeout=timeout_sec, low_memory=low_memory, live=live)
+  if status == 'ok':
+    log.info(f'[ok] {audio_path.name}')
+    if settings.OUTPUT_TARGETS:
+      _mark(audio_path, 'done')
+  elif status == 'aborted':
+    # lease lost: the node that holds it now finishes (and marks) the file
+    log.warning(f'[aborted] {audio_path.name}')
+  elif status == 'timeout':
+    log.warning(f'[timeout] {audio_path.name}')
+    _mark(audio_path, 'timeout', note=f'timeout={timeout_sec}s')
+  else:
+    log.error(f'[error] {audio_path.name}')
+    _mark(audio_path, 'failed')
+
+def _update_load_gauges(n_managers: int, idle: queue.Queue, budget: MemoryBudget):
+  metrics.set('speechcut_jobs_running', n_managers - idle.qsize())
+  metrics.set('speechcut_memory_reserved_bytes', budget.used)
+
+def _run_job(plan: JobPlan, manager: Supervisor, idle: queue.Queue, n_managers: int,
+             locker: ProcessingLock, budget: MemoryBudget, wake: threading.Event, timeout_sec: int):
+  audio_path = plan.path
   try:
-    status = manager.process(str(audio_path), timeout=timeout_sec)
-    if status == 'ok':
-      log.info(f'[ok] {audio_path.name}')
-    elif status == 'timeout':
-      log.warning(f'[timeout] {audio_path.name}')
-      _mark(audio_path, 'timeout', note=f'timeout={timeout_sec}s')
-    else:
-      log.error(f'[error] {audio_path.name}')
-      _mark(audio_path, 'failed')
+    process_file(audio_path, manager, timeout_sec=timeout_sec, low_memory=plan.low_memory, live=plan.live)
+  except Exception:
+    log.exception(f'[error] {audio_path.name}')
   finally:
+    budget.release(audio_path)
     locker.unlock(audio_path)
+    idle.put(manager)
+    _update_load_gauges(n_managers, idle, budget)
+    wake.set()
 
 def run_scheduler(polling_seconds: int = 60, timeout_sec: int = 600, log_queue=None):
   started_at = datetime.now()
+  if not rss_bytes():
+    # without psutil (e.g. on Windows) RSS is unknown and reported as 0
+    log.warning('[startup] worker RSS cannot be measured (install psutil); speechcut_worker_rss_bytes stays unset '
+                'and standby workers reserve no memory')
+    if settings.WORKER_MAX_RSS_MB:
+      log.warning(f'[startup] WORKER_MAX_RSS_MB={settings.WORKER_MAX_RSS_MB} has no effect without RSS')
   
-  locker = ProcessingLock()
-  manager = Supervisor(default_timeout=timeout_sec, log_queue=log_queue)
-
-  log.info(f'Scheduler started at {started_at}. Polling every {polling_seconds} sec.')
+  # a lost lease means another node may have taken the file over: stop our copy of the job
+  def on_lease_lost(path: Path):
+    for m in managers:
+      m.abort(path)
+
+  # lease files let several instances/hosts share INPUT_DIRs without duplicate work
+  locker = LeaseLock(settings.LEASE_TTL_SECONDS, on_lost=on_lease_lost) if settings.LEASE_ENABLED else ProcessingLock()
+  budget = MemoryBudget(settings.MEMORY_BUDGET_BYTES)
+  managers = [
+    Supervisor(default_timeout=timeout_sec, log_queue=log_queue, threads=threads, cpus=cpus,
+               pin=settings.WORKER_PIN_CPUS, worker_id=i, budget=budget)
+    for i, (cpus, threads) in enumerate(plan_cpu_sets(settings.MAX_WORKERS, settings.WORKER_THREADS))
+  ]
+  idle: queue.Queue[Supervisor] = queue.Queue()
+  for m in managers:
+    idle.put(m)
+  wake = threading.Event()
+  metrics_server = start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT) if settings.METRICS_PORT else None
+
+  log.info(f'Scheduler started at {started_at}. Polling every {polling_seconds} sec, {len(managers)} worker(s).')
   try:
     while True:
       cycle_start = time.time()
+      wake.clear()
 
-      files = get_unprocessed_audio_files(started_at)
+      files = [f for f in get_unprocessed_audio_files(started_at) if not locker.is_locked(f)]
       log.info(f'[{datetime.now().isoformat()}] {len(files)} target(s).')
 
-      # only ONE file get processed
-      if files:
-        process_file(files[0], locker, manager, timeout_sec=timeout_sec)
-      else:
+      if not files:
         log.info('[idle] no new files')
 
-      # if it takes over 1 minute to process, the next cycle will be delayed.
-      elapsed = time.time() - cycle_start
-      sleep_time = max(0.0, polling_seconds - elapsed)
-      time.sleep(sleep_time)
+      # dispatch in mtime order while a worker is idle and the job fits the memory budget
+      dispatched = 0
+      for audio_path in files:
+        if idle.empty():
+          break
+        live = _is_live(audio_path)
+        if live and audio_path.stat().st_size == 0:
+          # just created by the recorder; nothing to decode yet
+          log.info(f'[defer] {audio_path.name}: empty live recording')
+          continue
+        try:
+          plan = plan_job(audio_path, live=live)
+        except Exception as e:
+          log.error(f'[error] probe failed: {audio_path.name}: {e}')
+          _mark(audio_path, 'failed', note=f'probe failed: {e}')
+          continue
+        if not budget.try_acquire(audio_path, plan.estimated_bytes):
+          log.info(f'[defer] {audio_path.name}: ~{plan.estimated_bytes / 2**20:.0f}MB does not fit '
+                   f'({budget.used / 2**20:.0f}/{budget.ceiling / 2**20:.0f}MB in use)')
+          break
+        if not locker.try_lock(audio_path):
+          budget.release(audio_path)
+          log.info(f'[skip] claimed elsewhere: {audio_path.name}')
+          continue
+        if _is_finished(audio_path):
+          # another instance finished it between our scan and our claim
+          locker.unlock(audio_path)
+          budget.release(audio_path)
+          continue
+        threading.Thread(
+          target=_run_job,
+          args=(plan, idle.get_nowait(), idle, len(managers), locker, budget, wake, timeout_sec),
+          daemon=True,
+        ).start()
+        dispatched += 1
+
+      metrics.set('speechcut_jobs_pending', len(files) - dispatched)
+      _update_load_gauges(len(managers), idle, budget)
+
+      # wake early when a job finishes so the next one is admitted without waiting a full cycle
+      # (short waits keep Ctrl+C responsive on Windows)
+      deadline = cycle_start + polling_seconds
+      while time.time() < deadline and not wake.wait(min(1.0, deadline - time.time())):
+        pass
   except KeyboardInterrupt:
     log.info('\nScheduler stopped by user.')
   finally:
-    manager.shutdown()
+    if metrics_server is not None:
+      metrics_server.shutdown()
+    for m in managers:
+      m.shutdown()
+    locker.close()
 
 if __name__ == '__main__':
   # safe guard for windows
@@ -1,9 +1,11 @@
-import os, re, time, logging
+import os, re, time, logging, cProfile
 from multiprocessing import Process
+from speechcut.config.settings import settings
 from speechcut.utils.logging_setup import install_log_queue_handler
-from speechcut.ml.vad.silero import SileroVADWrapper
-from speechcut.ml.classifier.yamnet import YamnetWrapper
-from speechcut.pipelines.speech_extractor import SpeechExtractor
+from speechcut.utils.proc import rss_bytes
+from speechcut.utils.profiling import should_profile, write_profile
+from speechcut.utils.threads import apply_thread_budget
+from speechcut.pipelines.checkpoint import prune_checkpoints
 
 AUDIO_EXTS = {'.wav', '.mp3', '.flac'}
 DELAY_PATTERN = re.compile(r'__delay(\d+)', re.IGNORECASE)
@@ -18,11 +20,14 @@ def _maybe_delay(audio_path: str):
     time.sleep(sec)
 
 class WorkerProcess(Process):
-  def __init__(self, task_queue, result_queue, log_queue=None):
+  def __init__(self, task_queue, result_queue, log_queue=None, threads: int = 0, cpus: list[int] | None = None, pin: bool = False):
     super().__init__()
     self.task_queue = task_queue
     self.result_queue = result_queue
     self.log_queue = log_queue
+    self.threads = threads
+    self.cpus = cpus
+    self.pin = pin
 
   def run(self):
     if self.log_queue is not None:
@@ -30,9 +35,22 @@ class WorkerProcess(Process):
     log = logging.getLogger('speechcut.worker')
     try:
       log.info(f'[worker] starting, pid={os.getpid()}')
+      t0 = time.perf_counter()
+      apply_thread_budget(self.threads, self.cpus, pin=self.pin)  # before the models initialize their pools
+      # imported here, not at module level: unpickling this process in the spawn child would
+      # otherwise load torch/TensorFlow before the thread budget above is applied
+      from speechcut.ml.vad.silero import SileroVADWrapper
+      from speechcut.ml.classifier.yamnet import YamnetWrapper
+      from speechcut.pipelines.speech_extractor import SpeechExtractor
       vad_model = SileroVADWrapper()
       cls_model = YamnetWrapper()
       log.info(f'[worker] models loaded, pid={os.getpid()}')
+      prune_checkpoints()
+      self.result_queue.put({
+        'type': 'ready', 'pid': os.getpid(),
+        'load_seconds': time.perf_counter() - t0,
+        'rss': rss_bytes(),  # resident models; the supervisor reserves this much for a standby
+      })
     except Exception as e:
       log.exception("model_load_failed")
       self.result_queue.put({'type': 'fatal', 'error': f'model_load_failed: {e}'})
@@ -52,14 +70,39 @@ class WorkerProcess(Process):
         task_id = msg.get('id')
         audio_path = msg.get('path')
 
+        # off by default; only flagged jobs pay for cProfile
+        profiler = cProfile.Profile() if should_profile(audio_path) else None
+        speechExtractor = None
         try:
+          if profiler is not None:
+            profiler.enable()
           _maybe_delay(audio_path)  # ← Test delay hook
           speechExtractor = SpeechExtractor(
             audio_path,
             vad_model=vad_model,
-            classification_model=cls_model
+            classification_model=cls_model,
+            chunk_seconds=settings.LOW_MEMORY_CHUNK_SECONDS if msg.get('low_memory') else None,
+            ffmpeg_threads=self.threads,
           )
-          speechExtractor.speech_music_separate()
-          self.result_queue.put({'type': 'done', 'id': task_id})
+          if msg.get('live'):
+            speechExtractor.speech_music_separate_live(
+              on_progress=lambda pos, task_id=task_id: self.result_queue.put({'type': 'progress', 'id': task_id, 'position': pos})
+            )
+          else:
+            speechExtractor.speech_music_separate()
+          self.result_queue.put({
+            'type': 'done', 'id': task_id,
+            'audio_seconds': speechExtractor.processed_seconds,
+            'stages': speechExtractor.stage_seconds,
+            'rss': rss_bytes(),
+          })
         except Exception as e:
-          self.result_queue.put({'type': 'error', 'id': task_id, 'error': str(e)})
+          self.result_queue.put({'type': 'error', 'id': task_id, 'error': str(e), 'rss': rss_bytes()})
+        finally:
+          if profiler is not None:
+            profiler.disable()
+            try:
+              extra = {'stages': speechExtractor.stage_seconds, 'ffmpeg': speechExtractor.ffmpeg_seconds} if speechExtractor else {}
+              write_profile(profiler, audio_path, extra)
+            except Exception:
+              log.exception('[worker] failed to write profile')
@@ -2,9 +2,12 @@ import json
 import logging
 import re
 import subprocess
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Union
 import ffmpeg
+import numpy as np
 
 from speechcut.config.settings import settings
 
@@ -21,8 +24,10 @@ class AudioProcessor:
     output_br (str): Output MP3 bitrate (e.g., '192k')
     output_ch (int): Output number of audio channels
     max_bytes (int): Maximum buffer size allowed (in bytes)
+    ffmpeg_threads (int): Thread budget passed to ffmpeg (0 = ffmpeg default)
     silence_boundaries (list): Detected silence intervals (start, end)
     audio_info (dict): Cached audio metadata
+    ffmpeg_seconds (dict): Wall time spent in ffmpeg/ffprobe subprocesses, per call site
   '''
 
   def __init__(
@@ -35,6 +40,7 @@ class AudioProcessor:
     output_br: str = settings.OUTPUT_BR,
     output_ch: int = settings.OUTPUT_CH,
     max_bytes: int = settings.MAX_AUDIO_BYTES,
+    ffmpeg_threads: int = 0,
   ):
     self.source_audio_path = Path(path) if isinstance(path, str) else path
 
@@ -45,9 +51,19 @@ class AudioProcessor:
     self.output_br = output_br
     self.output_ch = output_ch
     self.max_bytes = max_bytes
+    self.ffmpeg_threads = ffmpeg_threads
 
     self.silence_boundaries: list[tuple[float, float]] | None = None
     self.audio_info: dict | None = None
+    self.ffmpeg_seconds: dict[str, float] = {}
+
+  @contextmanager
+  def _ffmpeg_timer(self, name: str):
+    t0 = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.ffmpeg_seconds[name] = self.ffmpeg_seconds.get(name, 0.0) + time.perf_counter() - t0
 
   def get_audio_info(self, get_new_info: bool = False) -> dict:
     if self.audio_info and not get_new_info:
@@ -61,7 +77,8 @@ class AudioProcessor:
       '-show_entries', 'format=duration',
       '-of', 'json', path,
     ]
-    info = subprocess.check_output(cmd, text=True)
+    with self._ffmpeg_timer('ffprobe'):
+      info = subprocess.check_output(cmd, text=True)
     stream_info = json.loads(info)['streams'][0]
     format_info = json.loads(info)['format']
     format_dur = float(format_info.get('duration'))
@@ -71,6 +88,37 @@ class AudioProcessor:
     self.audio_info = stream_info
     return stream_info
 
+  def _ffmpeg_thread_args(self) -> list[str]:
+    '''Global ffmpeg options limiting filter graph threads.'''
+    if not self.ffmpeg_threads:
+      return []
+    n = str(self.ffmpeg_threads)
+    return ['-filter_threads', n, '-filter_complex_threads', n]
+
+  def _ffmpeg_output_threads(self) -> dict:
+    '''Per-output `-threads` option (codec threads); must precede the output path.'''
+    return {'threads': self.ffmpeg_threads} if self.ffmpeg_threads else {}
+
+  def read_pcm(self, start_s: float = 0.0, duration_s: float | None = None) -> np.ndarray:
+    '''
+    Decode `[start_s, start_s + duration_s)` of the source as float32 PCM
+    at `processing_sr` / `processing_ch`, without loading the rest of the file.
+    If `duration_s` is None, decode to the current end of the file.
+    '''
+    input_kwargs = {'ss': start_s}
+    if duration_s is not None:
+      input_kwargs['t'] = duration_s
+    with self._ffmpeg_timer('decode'):
+      out, _ = (
+        ffmpeg
+        .input(str(self.source_audio_path), **input_kwargs)
+        .output('pipe:', format='f32le', acodec='pcm_f32le', ac=self.processing_ch, ar=self.processing_sr,
+                **self._ffmpeg_output_threads())
+        .global_args(*self._ffmpeg_thread_args())
+        .run(capture_stdout=True, capture_stderr=True, quiet=True)
+      )
+    return np.frombuffer(out, dtype=np.float32).copy()
+
   def _detect_silence(
     self,
     noise: str = settings.SILENCE_DB or '-30dB',
@@ -96,13 +144,15 @@ class AudioProcessor:
     a_info: dict = self.get_audio_info()
     dur: float = a_info['duration']
 
-    _, stderr = (
-      ffmpeg
-      .input(str(self.source_audio_path))
-      .filter('silencedetect', noise=noise, d=d)
-      .output('null', format='null')
-      .run(capture_stdout=True, capture_stderr=True, quiet=True)
-    )
+    with self._ffmpeg_timer('silencedetect'):
+      _, stderr = (
+        ffmpeg
+        .input(str(self.source_audio_path))
+        .filter('silencedetect', noise=noise, d=d)
+        .output('null', format='null', **self._ffmpeg_output_threads())
+        .global_args(*self._ffmpeg_thread_args())
+        .run(capture_stdout=True, capture_stderr=True, quiet=True)
+      )
 
     if isinstance(stderr, (bytes, bytearray)):
       stderr = stderr.decode('utf-8', errors='ignore')
@@ -61,6 +61,28 @@ def _read_input_dirs_from_env(
   # If it is not JSON or is empty, handle it as a single value(in the list).
   return [_norm_env_path(name, default_rel, base)]
 
+def _read_output_targets_from_env(name: str = 'OUTPUT_TARGETS') -> list[dict]:
+  '''
+    OUTPUT_TARGETS in the .env is a JSON list of objects, e.g.
+    [{"format": "flac"}, {"format": "mp3", "bitrate": "192k", "sample_rate": 44100, "channels": 2, "dir": "mp3"}].
+    If empty, the single default output (next to the source) is used.
+    "dir" must be a relative path that stays under OUTPUT_DIR.
+  '''
+  raw = (os.getenv(name) or '').strip()
+  if not raw:
+    return []
+  try:
+    arr = json.loads(raw)
+  except Exception as e:
+    raise ValueError(f'{name} failed to parse JSON: {e}')
+  if not isinstance(arr, list) or not all(isinstance(t, dict) and t.get('format') for t in arr):
+    raise ValueError(f'{name} must be a JSON list of objects with a "format" key')
+  for t in arr:
+    d = Path(str(t.get('dir', '')))
+    if d.is_absolute() or d.drive or '..' in d.parts:
+      raise ValueError(f'{name}: "dir" must be relative to OUTPUT_DIR without "..": {t.get("dir")!r}')
+  return arr
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 class Settings:
@@ -85,6 +107,8 @@ class Settings:
   OUTPUT_CH = int(os.getenv('OUTPUT_CH', 2))
   OUTPUT_BR = os.getenv('OUTPUT_BR', '192k')
   OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'mp3')
+  # Multiple outputs rendered in one pass, written under OUTPUT_DIR
+  OUTPUT_TARGETS: list[dict] = _read_output_targets_from_env('OUTPUT_TARGETS')
 
   # Silence detection
   SILENCE_DB = os.getenv('SILENCE_DB', '-30dB')
@@ -97,11 +121,53 @@ class Settings:
   MERGE_GAP_SECONDS = int(os.getenv('MERGE_GAP_SECONDS', 10))
   MARGIN_SECONDS = int(os.getenv('MARGIN_SECONDS', 4))
   FADE_SECONDS = float(os.getenv('FADE_SECONDS', 0.5))
+
+  # Spectral pre-screen before YAMNet (scores inside the band go to YAMNet)
+  PRESCREEN_ENABLED = os.getenv('PRESCREEN_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+  PRESCREEN_MUSIC_BELOW = float(os.getenv('PRESCREEN_MUSIC_BELOW', 0.15))
+  PRESCREEN_SPEECH_ABOVE = float(os.getenv('PRESCREEN_SPEECH_ABOVE', 0.85))
+  PRESCREEN_MIN_SECONDS = float(os.getenv('PRESCREEN_MIN_SECONDS', 5.0))
   
   LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
-  # File size limit
+  # Prometheus metrics endpoint (0 = disabled)
+  METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+  METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+  # Per-job profiling (also enabled by a `__profile` tag in the filename)
+  PROFILE_ALL = os.getenv('PROFILE_ALL', 'false').lower() in ('1', 'true', 'yes')
+  PROFILE_PATTERNS: list[str] = [p for p in json.loads(os.getenv('PROFILE_PATTERNS') or '[]') if p]
+  PROFILE_DIR: Path = _norm_env_path('PROFILE_DIR', LOG_DIR / 'profiles', ROOT_DIR)
+  PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', 30))
+
+  # Stage checkpoints (resume retries from the last completed stage; only written when JOB_RETRIES > 0)
+  CHECKPOINT_ENABLED = os.getenv('CHECKPOINT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+  WORK_DIR: Path = _norm_env_path('WORK_DIR', 'work', ROOT_DIR)
+  CHECKPOINT_MAX_AGE_DAYS = float(os.getenv('CHECKPOINT_MAX_AGE_DAYS', 7))
+  JOB_RETRIES = int(os.getenv('JOB_RETRIES', 0))  # extra attempts after a timeout/error
+
+  # Lease files for sharing INPUT_DIR between instances/hosts
+  LEASE_ENABLED = os.getenv('LEASE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+  LEASE_TTL_SECONDS = float(os.getenv('LEASE_TTL_SECONDS', 300))
+
+  # File size limit (larger files are processed in low-memory chunks)
   MAX_AUDIO_BYTES = int(os.getenv('MAX_AUDIO_BYTES', 100 * 1024 * 1024))  # 100MB
 
+  # Concurrency / memory admission
+  MAX_WORKERS = int(os.getenv('MAX_WORKERS', 1))
+  WORKER_THREADS = int(os.getenv('WORKER_THREADS', 0))  # per worker; 0 = available CPUs / MAX_WORKERS
+  WORKER_PIN_CPUS = os.getenv('WORKER_PIN_CPUS', 'false').lower() in ('1', 'true', 'yes')
+  # Worker recycling limits (0 = unlimited)
+  WORKER_MAX_TASKS = int(os.getenv('WORKER_MAX_TASKS', 0))
+  WORKER_MAX_RSS_MB = int(os.getenv('WORKER_MAX_RSS_MB', 0))
+  MEMORY_BUDGET_BYTES = int(os.getenv('MEMORY_BUDGET_BYTES', 4 * 1024 * 1024 * 1024))  # 4GB across running jobs
+  LOW_MEMORY_CHUNK_SECONDS = float(os.getenv('LOW_MEMORY_CHUNK_SECONDS', 600))
+
+  # Live recordings (files still being written are tailed instead of processed at once)
+  LIVE_MODE = os.getenv('LIVE_MODE', 'false').lower() in ('1', 'true', 'yes')
+  LIVE_IDLE_SECONDS = float(os.getenv('LIVE_IDLE_SECONDS', 120))
+  LIVE_POLL_SECONDS = float(os.getenv('LIVE_POLL_SECONDS', 10))
+  LIVE_GUARD_SECONDS = float(os.getenv('LIVE_GUARD_SECONDS', 30))  # must be below the chunk length
+
 
 settings = Settings()
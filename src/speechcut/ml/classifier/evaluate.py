@@ -0,0 +1,91 @@
+'''
+Compare the pre-screen cascade with YAMNet-only classification on a labeled set.
+
+The label file is a CSV with the header `path,start,end,label`
+(start/end in seconds, label `speech` for segments to keep and anything else for segments to drop).
+
+  python -m speechcut.ml.classifier.evaluate labels.csv
+'''
+from __future__ import annotations
+import argparse
+import csv
+import time
+from pathlib import Path
+
+from speechcut.config.settings import settings
+from speechcut.ml.classifier.prescreen import SpectralPrescreen
+
+def _load_rows(label_csv: Path) -> list[dict]:
+  with open(label_csv, newline='', encoding='utf-8') as f:
+    return [
+      {'path': r['path'], 'start': float(r['start']), 'end': float(r['end']),
+       'speech': r['label'].strip().lower() == 'speech'}
+      for r in csv.DictReader(f)
+    ]
+
+def evaluate(
+  label_csv: Path,
+  music_below: float = settings.PRESCREEN_MUSIC_BELOW,
+  speech_above: float = settings.PRESCREEN_SPEECH_ABOVE,
+  speech_threshold: float = settings.SPEECH_THRESHOLD,
+) -> dict:
+  from speechcut.ml.vad.silero import SileroVADWrapper
+  from speechcut.ml.classifier.yamnet import YamnetWrapper
+
+  sr = settings.PROCESSING_SR
+  reader = SileroVADWrapper(sr=sr)
+  yamnet = YamnetWrapper()
+  prescreen = SpectralPrescreen(sr=sr, music_below=music_below, speech_above=speech_above)
+
+  rows = _load_rows(label_csv)
+  waves: dict[str, object] = {}
+  n = resolved = yamnet_ok = cascade_ok = prescreen_ok = 0
+  yamnet_sec = prescreen_sec = 0.0
+
+  for row in rows:
+    if row['path'] not in waves:
+      waves[row['path']] = reader.read_audio(row['path'], sampling_rate=sr)
+    audio = waves[row['path']][int(row['start'] * sr):int(row['end'] * sr)].squeeze().numpy()
+
+    t0 = time.perf_counter()
+    label, _ = prescreen.decide(audio)
+    prescreen_sec += time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    probs = yamnet.predict(audio).mean(axis=0)
+    yamnet_sec += time.perf_counter() - t0
+    top_idx = int(probs.argmax())
+    yamnet_speech = yamnet.class_names[top_idx] == 'Speech' and float(probs[top_idx]) > speech_threshold
+
+    n += 1
+    yamnet_ok += yamnet_speech == row['speech']
+    if label is None:
+      cascade_ok += yamnet_speech == row['speech']
+    else:
+      resolved += 1
+      prescreen_ok += (label == 'Speech') == row['speech']
+      cascade_ok += (label == 'Speech') == row['speech']
+
+  return {
+    'segments': n,
+    'resolved_fraction': resolved / n if n else 0.0,
+    'prescreen_accuracy_on_resolved': prescreen_ok / resolved if resolved else 0.0,
+    'yamnet_accuracy': yamnet_ok / n if n else 0.0,
+    'cascade_accuracy': cascade_ok / n if n else 0.0,
+    'prescreen_seconds': prescreen_sec,
+    'yamnet_seconds': yamnet_sec,
+  }
+
+def main():
+  p = argparse.ArgumentParser(prog='speechcut-eval-prescreen', description=__doc__.strip().splitlines()[0])
+  p.add_argument('labels', type=Path, help='CSV with path,start,end,label')
+  p.add_argument('--music-below', type=float, default=settings.PRESCREEN_MUSIC_BELOW)
+  p.add_argument('--speech-above', type=float, default=settings.PRESCREEN_SPEECH_ABOVE)
+  args = p.parse_args()
+
+  report = evaluate(args.labels, music_below=args.music_below, speech_above=args.speech_above)
+  for k, v in report.items():
+    print(f'{k:<32} {v:.4f}' if isinstance(v, float) else f'{k:<32} {v}')
+
+if __name__ == '__main__':
+  main()
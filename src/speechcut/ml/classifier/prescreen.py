@@ -0,0 +1,129 @@
+from __future__ import annotations
+import numpy as np
+
+from speechcut.config.settings import settings
+
+class SpectralPrescreen:
+  '''
+  Cheap first stage of the classification cascade.
+
+  Scores a mono waveform with a few NumPy features and decides the clear cases directly:
+    - spectral flatness: noise-like (speech fricatives) vs tonal (music)
+    - zero-crossing-rate variability: speech alternates voiced/unvoiced frames
+    - 4 Hz modulation energy: syllable rate of speech
+    - harmonicity: sustained pitch of music
+
+  `decide()` returns 'Speech', 'Music' or None. None means the segment is ambiguous
+  and must be forwarded to YAMNet. A 'Speech' decision additionally needs positive evidence
+  (syllable-rate modulation and voiced/unvoiced alternation), so noise, applause or silence
+  that is merely "not tonal" always goes to YAMNet.
+  '''
+
+  MOD4_MIN = 0.4        # share of envelope modulation energy in 2-8 Hz
+  ZCR_STD_MIN = 0.06    # spread of per-frame zero-crossing rate
+  SILENCE_RMS = 1e-4    # frame RMS below which a segment carries no usable features
+
+  def __init__(
+    self,
+    sr: int = settings.PROCESSING_SR,
+    music_below: float = settings.PRESCREEN_MUSIC_BELOW,
+    speech_above: float = settings.PRESCREEN_SPEECH_ABOVE,
+    min_seconds: float = settings.PRESCREEN_MIN_SECONDS,
+  ):
+    if not 0.0 <= music_below < speech_above <= 1.0:
+      raise ValueError('confidence band must satisfy 0 <= music_below < speech_above <= 1')
+    self.sr = sr
+    self.music_below = music_below
+    self.speech_above = speech_above
+    self.min_seconds = min_seconds
+
+    self.frame_len = int(0.025 * sr)  # 25 ms
+    self.hop_len = int(0.010 * sr)    # 10 ms -> 100 frames/s envelope
+    self.min_lag = int(sr / 400)      # pitch search range 50-400 Hz
+    self.max_lag = int(sr / 50)
+
+  def _frames(self, x: np.ndarray) -> np.ndarray:
+    n = max(0, 1 + (len(x) - self.frame_len) // self.hop_len)
+    idx = np.arange(self.frame_len)[None, :] + self.hop_len * np.arange(n)[:, None]
+    return x[idx]
+
+  def features(self, waveform) -> dict[str, float] | None:
+    '''Feature dict, or None if the waveform is too short (< 2 frames) or silent.'''
+    x = np.asarray(waveform, dtype=np.float32).reshape(-1)
+    frames = self._frames(x)
+    if len(frames) < 2:
+      return None
+    energy = np.sqrt((frames ** 2).mean(axis=1)) + 1e-9
+    if energy.max() < self.SILENCE_RMS:
+      return None
+    # drop near-silent frames so pauses do not dominate the statistics
+    active = frames[energy > energy.max() * 0.05]
+    if len(active) < 2:
+      active = frames
+
+    window = np.hanning(self.frame_len).astype(np.float32)
+    power = np.abs(np.fft.rfft(active * window, axis=1)) ** 2 + 1e-12
+    flatness = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+
+    signs = np.signbit(active)
+    zcr = (signs[:, 1:] != signs[:, :-1]).mean(axis=1)
+
+    # modulation spectrum of the (full) energy envelope; 2-8 Hz band around the syllable rate
+    env = energy - energy.mean()
+    mod = np.abs(np.fft.rfft(env)) ** 2
+    mod_freqs = np.fft.rfftfreq(len(env), d=self.hop_len / self.sr)
+    band = (mod_freqs >= 2.0) & (mod_freqs <= 8.0)
+    mod_total = mod[mod_freqs > 0.5].sum() + 1e-12
+    mod4 = float(mod[band].sum() / mod_total)
+
+    # normalized autocorrelation peak in the pitch range, via FFT
+    centered = active - active.mean(axis=1, keepdims=True)
+    spec = np.fft.rfft(centered, n=2 * self.frame_len, axis=1)
+    ac = np.fft.irfft(np.abs(spec) ** 2, axis=1)[:, :self.frame_len]
+    peak = ac[:, self.min_lag:min(self.max_lag, self.frame_len - 1)].max(axis=1)
+    harmonicity = np.clip(peak / (ac[:, 0] + 1e-12), 0.0, 1.0)
+
+    return {
+      'flatness': float(flatness.mean()),
+      'zcr_std': float(zcr.std()),
+      'mod4': mod4,
+      'harmonicity': float(harmonicity.mean()),
+    }
+
+  @staticmethod
+  def _score(f: dict[str, float]) -> float:
+    # flatness only separates tonal (low) from speech; noise is flatter than speech, so values
+    # above the speech range count against it instead of saturating towards 'Speech'
+    flat = f['flatness']
+    z = (
+      4.0 * (f['mod4'] - 0.35)
+      + 30.0 * (f['zcr_std'] - 0.05)
+      + 6.0 * (min(flat, 0.3) - 0.15)
+      - 10.0 * max(0.0, flat - 0.45)
+      - 5.0 * (f['harmonicity'] - 0.6)
+    )
+    return float(1.0 / (1.0 + np.exp(-z)))
+
+  def score(self, waveform) -> float:
+    '''Speech likelihood in [0, 1] (0.5 when there are no usable features). Weights are hand-tuned; retune with `evaluate`.'''
+    f = self.features(waveform)
+    return 0.5 if f is None else self._score(f)
+
+  def decide(self, waveform) -> tuple[str | None, float]:
+    '''
+    Return `(label, score)`; label is None when the score is inside the confidence band,
+    the segment is too short or silent, or a high score lacks speech evidence.
+    '''
+    if len(waveform) < self.min_seconds * self.sr:
+      return None, 0.0
+    f = self.features(waveform)
+    if f is None:
+      return None, 0.5
+    s = self._score(f)
+    if s >= self.speech_above:
+      if f['mod4'] >= self.MOD4_MIN and f['zcr_std'] >= self.ZCR_STD_MIN:
+        return 'Speech', s
+      return None, s
+    if s <= self.music_below:
+      return 'Music', s
+    return None, s
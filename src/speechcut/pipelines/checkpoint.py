@@ -0,0 +1,80 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any
+
+from speechcut.config.settings import settings
+
+log = logging.getLogger(__name__)
+
+STAGES = ('vad', 'classified', 'silence', 'final')
+_EDGE_BYTES = 1024 * 1024
+
+def file_fingerprint(path: Path) -> str:
+  '''Cheap content fingerprint: size, mtime and hashes of the first and last MiB.'''
+  st = path.stat()
+  h = hashlib.sha1(f'{st.st_size}:{st.st_mtime_ns}'.encode())
+  with open(path, 'rb') as f:
+    h.update(f.read(_EDGE_BYTES))
+    if st.st_size > _EDGE_BYTES:
+      f.seek(max(_EDGE_BYTES, st.st_size - _EDGE_BYTES))
+      h.update(f.read(_EDGE_BYTES))
+  return h.hexdigest()
+
+class StageCheckpoint:
+  '''
+  Per-job work directory holding the results of completed pipeline stages as JSON.
+
+  The directory name is derived from the source fingerprint and the analysis settings, so a retry
+  (or a fresh worker after a timeout) of the same file with the same settings resumes from the last
+  completed stage, while a changed file or changed settings start over.
+  '''
+
+  def __init__(self, path: Path, params: dict[str, Any], work_dir: Path = settings.WORK_DIR):
+    key = hashlib.sha1(
+      (file_fingerprint(path) + json.dumps(params, sort_keys=True, default=str)).encode()
+    ).hexdigest()[:16]
+    self.dir = work_dir / f'{path.stem}-{key}'
+
+  def load(self, stage: str) -> Any | None:
+    p = self.dir / f'{stage}.json'
+    if not p.exists():
+      return None
+    try:
+      data = json.loads(p.read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+      log.warning(f'[checkpoint] ignoring unreadable {p}: {e}')
+      return None
+    log.info(f'[checkpoint] resume from {stage}: {self.dir.name}')
+    return data
+
+  def save(self, stage: str, data: Any) -> None:
+    if stage not in STAGES:
+      raise ValueError(f'unknown stage: {stage}')
+    self.dir.mkdir(parents=True, exist_ok=True)
+    p = self.dir / f'{stage}.json'
+    tmp = p.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data), encoding='utf-8')
+    os.replace(tmp, p)
+
+  def clear(self) -> None:
+    shutil.rmtree(self.dir, ignore_errors=True)
+
+def prune_checkpoints(work_dir: Path = settings.WORK_DIR, max_age_days: float = settings.CHECKPOINT_MAX_AGE_DAYS) -> None:
+  '''Remove work directories of jobs that were abandoned (failed for good) more than `max_age_days` ago.'''
+  try:
+    entries = list(work_dir.iterdir()) if work_dir.exists() else []
+  except OSError:
+    return
+  cutoff = time.time() - max_age_days * 86400
+  for d in entries:
+    try:
+      if d.is_dir() and d.stat().st_mtime < cutoff:
+        shutil.rmtree(d, ignore_errors=True)
+    except OSError:
+      continue
@@ -1,9 +1,13 @@
-import subprocess, logging
+import os, subprocess, logging, time, uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union
+from typing import Callable, Union
+import numpy as np
 
 from speechcut.audio.processor import AudioProcessor
 from speechcut.config.settings import settings
+from speechcut.ml.classifier.prescreen import SpectralPrescreen
+from speechcut.pipelines.checkpoint import StageCheckpoint
 
 log = logging.getLogger(__name__)
 
@@ -26,24 +30,209 @@ class SpeechExtractor(AudioProcessor):
     fade_len_s: float = settings.FADE_SECONDS,
     min_speech_ms: int = settings.MIN_SPEECH_MS,
     speech_threshold: float = settings.SPEECH_THRESHOLD,
+    prescreen: SpectralPrescreen | None = None,
+    chunk_seconds: float | None = None,
+    ffmpeg_threads: int = 0,
+    output_targets: list[dict] | None = None,
+    checkpoint: bool = settings.CHECKPOINT_ENABLED and settings.JOB_RETRIES > 0,
   ):
-    super().__init__(path, sr, channels, output_sr, output_br, output_ch, max_bytes)
+    super().__init__(path, sr, channels, output_sr, output_br, output_ch, max_bytes, ffmpeg_threads)
 
     self.merge_gap_s = merge_gap_s
     self.margin_s = margin_s
     self.fade_len_s = fade_len_s
     self.min_speech_ms = min_speech_ms
     self.speech_threshold = speech_threshold
+    # low-memory mode: decode/VAD/classify `chunk_seconds` at a time instead of the whole file
+    self.chunk_seconds = chunk_seconds
+    # multi-output rendering (see `ffmpeg_concat_fade`); None keeps the single output next to the source
+    self.output_targets = output_targets if output_targets is not None else (settings.OUTPUT_TARGETS or None)
+    # persist stage results under WORK_DIR so a retry resumes instead of starting over
+    # (only useful with JOB_RETRIES; nothing else reads them)
+    self.checkpoint = checkpoint
+    self._ckpt: StageCheckpoint | None = None
 
     self.vad_model = vad_model
     self.classification_model = classification_model
+    if prescreen is None and settings.PRESCREEN_ENABLED:
+      prescreen = SpectralPrescreen(sr=sr)
+    self.prescreen = prescreen
+    self.cascade_stats = {'segments': 0, 'prescreen_speech': 0, 'prescreen_music': 0, 'yamnet': 0}
+    # wall time per stage (decode, vad, classify, margins, render), accumulated across chunks
+    self.stage_seconds: dict[str, float] = {}
+    self.processed_seconds = 0.0
+
+  @contextmanager
+  def _stage(self, name: str):
+    t0 = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - t0
 
   def speech_music_separate(self):
-    timestamps, wav = self.get_vad_timestamps()
-    speech_seg = self.sound_classification(timestamps, wav)
+    ckpt = self._ckpt = self._open_checkpoint()
+    final = ckpt.load('final') if ckpt else None
+    if final is not None:
+      self.processed_seconds = final['total_samples'] / self.processing_sr
+      with self._stage('render'):
+        self.ffmpeg_concat_fade(final['segments'], targets=self.output_targets)
+    else:
+      speech_seg, total_samples = self._analyze(ckpt)
+      self._finalize(speech_seg, total_samples, ckpt)
+    if ckpt:
+      ckpt.clear()
+
+  def _open_checkpoint(self) -> StageCheckpoint | None:
+    if not self.checkpoint:
+      return None
+    p = self.prescreen
+    params = {
+      'sr': self.processing_sr, 'ch': self.processing_ch,
+      'merge_gap_s': self.merge_gap_s, 'margin_s': self.margin_s, 'fade_len_s': self.fade_len_s,
+      'min_speech_ms': self.min_speech_ms, 'speech_threshold': self.speech_threshold,
+      'chunk_seconds': self.chunk_seconds,
+      'prescreen': (p.music_below, p.speech_above, p.min_seconds) if p else None,
+      'silence': (settings.SILENCE_DB, settings.SILENCE_DURATION, settings.SILENCE_PADDING),
+    }
+    try:
+      return StageCheckpoint(self.source_audio_path, params)
+    except OSError as e:
+      log.warning(f'checkpointing disabled for this job: {e}')
+      return None
+
+  def _analyze(self, ckpt: StageCheckpoint | None = None):
+    '''VAD + classification, resuming from the `classified` or `vad` checkpoint when present.'''
+    classified = ckpt.load('classified') if ckpt else None
+    if classified is not None:
+      return classified['speech_seg'], classified['total_samples']
+
+    if self.chunk_seconds:
+      speech_seg, total_samples = self.chunked_classification()
+    else:
+      vad = ckpt.load('vad') if ckpt else None
+      if vad is not None:
+        timestamps = vad['timestamps']
+        with self._stage('decode'):
+          wav = self.vad_model.read_audio(str(self.source_audio_path), sampling_rate=self.processing_sr)
+      else:
+        timestamps, wav = self.get_vad_timestamps()
+        timestamps = [{'start': int(t['start']), 'end': int(t['end'])} for t in timestamps]
+        if ckpt:
+          ckpt.save('vad', {'timestamps': timestamps, 'total_samples': len(wav)})
+      with self._stage('classify'):
+        speech_seg = self.sound_classification(timestamps, wav)
+      total_samples = len(wav)
+
+    if ckpt:
+      ckpt.save('classified', {'speech_seg': speech_seg, 'total_samples': total_samples})
+    return speech_seg, total_samples
+
+  def speech_music_separate_live(
+    self,
+    idle_seconds: float = settings.LIVE_IDLE_SECONDS,
+    poll_seconds: float = settings.LIVE_POLL_SECONDS,
+    guard_seconds: float = settings.LIVE_GUARD_SECONDS,
+    on_progress: Callable[[float], None] | None = None,
+  ):
+    '''
+    Process a recording that is still being written.
+    VAD and classification run on newly appended audio as it arrives; once the file
+    has not grown for `idle_seconds` it is treated as closed and only merge/margins/render remain.
+    '''
+    speech_seg, total_samples = self.tail_classification(idle_seconds, poll_seconds, guard_seconds, on_progress)
+    self.get_audio_info(get_new_info=True)
+    self._finalize(speech_seg, total_samples)
+
+  def _finalize(self, speech_seg, total_samples: int, ckpt: StageCheckpoint | None = None):
+    '''merge -> margins -> render, shared by all processing modes.'''
+    self.processed_seconds = total_samples / self.processing_sr
     merged = self.merge_segments(speech_seg)
-    merged = self.add_margins(merged, wav)
-    self.ffmpeg_concat_fade(merged)
+    silence = ckpt.load('silence') if ckpt else None
+    if silence is not None:
+      self.silence_boundaries = [tuple(b) for b in silence]
+    with self._stage('margins'):
+      merged = self.add_margins(merged, total_samples)
+    if ckpt:
+      ckpt.save('final', {'segments': merged, 'total_samples': total_samples})
+    with self._stage('render'):
+      self.ffmpeg_concat_fade(merged, targets=self.output_targets)
+
+  def tail_classification(
+    self,
+    idle_seconds: float,
+    poll_seconds: float,
+    guard_seconds: float,
+    on_progress: Callable[[float], None] | None = None,
+  ):
+    '''
+    Incremental variant of `chunked_classification` for a growing file.
+
+    Each increment decodes from the committed position to the current end of the file
+    (at most `chunk_seconds` at a time). VAD decisions within `guard_seconds` of the end lack
+    right context, so only segments ending before that horizon are committed. A segment crossing
+    the horizon is deferred whole: the next increment starts at its beginning, so live segments are
+    classified like batch ones. Only a segment longer than a whole chunk is cut, as in
+    `chunked_classification`.
+    '''
+    sr = self.processing_sr
+    chunk_s = self.chunk_seconds or settings.LOW_MEMORY_CHUNK_SECONDS
+    if chunk_s <= guard_seconds:
+      raise ValueError(f'chunk seconds ({chunk_s}) must be greater than LIVE_GUARD_SECONDS ({guard_seconds})')
+    guard = int(guard_seconds * sr)
+    path = self.source_audio_path
+    log.info(f'tailing {path.name} (closed after {idle_seconds}s without growth)')
+
+    speech_seg = []
+    pos = 0
+    last_size, last_growth = -1, time.monotonic()
+    while True:
+      size = path.stat().st_size
+      if size != last_size:
+        last_size, last_growth = size, time.monotonic()
+      closed = time.monotonic() - last_growth >= idle_seconds
+
+      with self._stage('decode'):
+        try:
+          wav = self.read_pcm(pos / sr, chunk_s)
+        except Exception as e:
+          # a recording that has just started may not have a decodable header yet
+          if closed:
+            raise
+          log.debug(f'{path.name} not decodable yet: {e}')
+          wav = np.zeros(0, dtype=np.float32)
+      at_eof = len(wav) < int(chunk_s * sr)
+      horizon = len(wav) if (closed and at_eof) else len(wav) - guard
+      if horizon > 0:
+        with self._stage('vad'):
+          timestamps = self.vad_model.get_speech_timestamps(wav, sampling_rate=sr)
+        committed = []
+        advance = horizon
+        for ts in timestamps:
+          if ts['start'] >= horizon:
+            break
+          if ts['end'] > horizon:
+            advance = ts['start']
+            break
+          committed.append(ts)
+        if advance == 0 and not at_eof:
+          # the open segment fills the whole chunk: cut it at the horizon to keep moving
+          committed.append({'start': timestamps[0]['start'], 'end': horizon})
+          advance = horizon
+        with self._stage('classify'):
+          self._classify_timestamps(committed, wav, speech_seg, pos)
+        pos += advance
+        if advance and on_progress is not None:
+          on_progress(pos / sr)
+
+      if closed and at_eof:
+        break
+      if at_eof:
+        time.sleep(poll_seconds)
+
+    log.info(f'{path.name} closed at {pos / sr:.1f}s')
+    self._log_classification_summary(speech_seg)
+    return speech_seg, pos
 
   def get_vad_timestamps(self):
     '''
@@ -52,26 +241,81 @@ class SpeechExtractor(AudioProcessor):
     '''
     audio_path = str(self.source_audio_path)
     v_model = self.vad_model
-    wav = v_model.read_audio(audio_path, sampling_rate=self.processing_sr)
-    speech_timestamps = v_model.get_speech_timestamps(
-      wav,
-      sampling_rate=self.processing_sr,
-    )
+    with self._stage('decode'):
+      wav = v_model.read_audio(audio_path, sampling_rate=self.processing_sr)
+    with self._stage('vad'):
+      speech_timestamps = v_model.get_speech_timestamps(
+        wav,
+        sampling_rate=self.processing_sr,
+      )
     return speech_timestamps, wav
 
-  def sound_classification(self, timestamps, wav):
+  def classify_segment(self, audio_seg) -> tuple[str, float]:
+    '''
+    Return `(top_label, top_prob)` for one segment.
+    Confident segments are decided by the spectral pre-screen; the rest go to YAMNet.
+    '''
+    self.cascade_stats['segments'] += 1
+    if self.prescreen is not None:
+      label, score = self.prescreen.decide(audio_seg)
+      if label == 'Speech':
+        self.cascade_stats['prescreen_speech'] += 1
+        return label, score
+      if label == 'Music':
+        self.cascade_stats['prescreen_music'] += 1
+        return label, 1.0 - score
+
+    self.cascade_stats['yamnet'] += 1
     c_model = self.classification_model
-    class_names = c_model.class_names
+    # long segments are scored in windows so YAMNet's activations stay bounded (see app.admission)
+    window = int(settings.LOW_MEMORY_CHUNK_SECONDS * self.processing_sr)
+    scores = np.concatenate([
+      c_model.predict(audio_seg[i:i + window]) for i in range(0, max(len(audio_seg), 1), window)
+    ])
+    avg_probs = scores.mean(axis=0)
+    top_idx = int(avg_probs.argmax())
+    return c_model.class_names[top_idx], float(avg_probs[top_idx])
+
+  def chunked_classification(self):
+    '''
+    Low-memory variant of `get_vad_timestamps` + `sound_classification`.
+    Only one chunk of decoded audio is held at a time; segment positions are global sample offsets.
+    Returns kept segments and the total number of decoded samples.
+    '''
+    duration = self.get_audio_info()['duration']
+    chunk_samples = int(self.chunk_seconds * self.processing_sr)
+    log.info(f'chunked processing: {duration:.1f}s in {self.chunk_seconds}s chunks')
+
+    speech_seg = []
+    offset = 0
+    while offset < duration * self.processing_sr:
+      with self._stage('decode'):
+        wav = self.read_pcm(offset / self.processing_sr, self.chunk_seconds)
+      if not len(wav):
+        break
+      with self._stage('vad'):
+        timestamps = self.vad_model.get_speech_timestamps(wav, sampling_rate=self.processing_sr)
+      with self._stage('classify'):
+        self._classify_timestamps(timestamps, wav, speech_seg, offset)
+      offset += len(wav)
+      if len(wav) < chunk_samples:
+        break
 
+    self._log_classification_summary(speech_seg)
+    return speech_seg, offset
+
+  def sound_classification(self, timestamps, wav):
     speech_seg = []
+    self._classify_timestamps(timestamps, wav, speech_seg)
+    self._log_classification_summary(speech_seg)
+    return speech_seg
 
-    for seg in timestamps:
-      audio_seg = wav[seg['start']:seg['end']].squeeze().numpy()
-      scores = c_model.predict(audio_seg)
-      avg_probs = scores.mean(axis=0)
-      top_idx = int(avg_probs.argmax())
-      top_label = class_names[top_idx]
-      top_prob = float(avg_probs[top_idx])
+  def _classify_timestamps(self, timestamps, wav, speech_seg: list, offset: int = 0):
+    '''Classify VAD `timestamps` local to `wav` and append kept ones to `speech_seg`, shifted by `offset` samples.'''
+    for local in timestamps:
+      audio_seg = np.asarray(wav[local['start']:local['end']]).squeeze()
+      top_label, top_prob = self.classify_segment(audio_seg)
+      seg = {'start': local['start'] + offset, 'end': local['end'] + offset}
 
       end_of_kept_seg = 0
       log.debug(f"{seg['start']/16000:8.2f}s-{seg['end']/16000:8.2f}s  →  {top_label:<20} {top_prob:.3f}")
@@ -84,10 +328,17 @@ class SpeechExtractor(AudioProcessor):
       ):
         speech_seg.append(seg)
 
+  def _log_classification_summary(self, speech_seg):
     if not speech_seg:
       log.warning('no speech. adjust speech_threshold.')
 
-    return speech_seg
+    stats = self.cascade_stats
+    if self.prescreen is not None and stats['segments']:
+      resolved = stats['prescreen_speech'] + stats['prescreen_music']
+      log.info(
+        f"prescreen resolved {resolved}/{stats['segments']} segment(s) "
+        f"({resolved / stats['segments']:.1%}; speech={stats['prescreen_speech']}, music={stats['prescreen_music']})"
+      )
 
   def merge_segments(self, speech_seg):
     merged = []
@@ -104,7 +355,15 @@ class SpeechExtractor(AudioProcessor):
     log.info(f'merged: {len(merged)}')
     return merged
 
-  def add_margins(self, speech_seg, wav):
+  def _detect_silence(self, *args, **kwargs):
+    '''Save freshly detected silence to the `silence` checkpoint right away (the margins may still time out).'''
+    cached = self.silence_boundaries
+    boundaries = super()._detect_silence(*args, **kwargs)
+    if self._ckpt and boundaries is not cached:
+      self._ckpt.save('silence', boundaries)
+    return boundaries
+
+  def add_margins(self, speech_seg, total_samples: int):
     log.info('add margins')
     final_seg = speech_seg.copy()
     margin = self.processing_sr * self.margin_s
@@ -113,9 +372,9 @@ class SpeechExtractor(AudioProcessor):
     if final_seg[0]['start'] >= margin:
       final_seg[0]['start'] -= (margin // 2)
 
-    tail_gap = len(wav) - final_seg[-1]['end']
+    tail_gap = total_samples - final_seg[-1]['end']
     if tail_gap >= margin:
-      final_seg[-1]['end'] = min(final_seg[-1]['end'] + margin, len(wav))
+      final_seg[-1]['end'] = min(final_seg[-1]['end'] + margin, total_samples)
 
     for i in range(len(speech_seg) - 1):
       log.debug(f'processing: gap #{i}')
@@ -137,25 +396,47 @@ class SpeechExtractor(AudioProcessor):
 
     return final_seg
 
-  def ffmpeg_concat_fade(self, segments, out_path=None, save_as_mp3=False):
+  def ffmpeg_concat_fade(self, segments, out_path=None, save_as_mp3=False, targets: list[dict] | None = None):
+    '''
+    Cut `segments` out of the source with fades and concatenate them.
+
+    Without `targets`, writes one file next to the source (or to `out_path`), in the source
+    container or as MP3 (`save_as_mp3`). With `targets`, the single decode + filter graph is split
+    into every target; each target is a dict with `format` (mp3/wav/flac) and optional `bitrate`,
+    `sample_rate`, `channels` and `dir` (relative to OUTPUT_DIR). MP3 targets default to
+    OUTPUT_BR/OUTPUT_SR/OUTPUT_CH.
+
+    Outputs are written to `.part` files and renamed into place only after ffmpeg succeeds.
+    Part names are unique per attempt, so a retry never writes into (or renames) the file of an
+    earlier attempt whose ffmpeg may still be running.
+    '''
     if not segments:
       raise ValueError('segments are empty')
     audio_path = self.source_audio_path
-    
-    if save_as_mp3:
-      br = self.output_br
-      ext = '.mp3'
+
+    if targets:
+      outputs = [self._target_output(t) for t in targets]
+      dests = [dest for dest, _ in outputs]
+      if len(set(dests)) != len(dests):
+        raise ValueError(f'output targets resolve to duplicate paths: {dests}')
     else:
-      meta = self.get_audio_info()
-      br = meta.get('bit_rate') or '1411000'
-      ext = audio_path.suffix.lower()
+      if save_as_mp3:
+        br = self.output_br
+        ext = '.mp3'
+      else:
+        meta = self.get_audio_info()
+        br = meta.get('bit_rate') or '1411000'
+        ext = audio_path.suffix.lower()
+
+      if out_path is None:
+        out_path = audio_path.with_name(f'{audio_path.stem}_speech_only{ext}')
+      outputs = [(Path(out_path), self._codec_args(ext, br))]
+    for dest, _ in outputs:
+      log.info(f'out_path: {dest}')
 
-    if out_path is None:
-      out_path = audio_path.with_name(f'{audio_path.stem}_speech_only{ext}')
-    log.info(f'out_path: {out_path}')
-    
     filter_parts = []
     concat_inputs = []
+    input_args = []
 
     for i, seg in enumerate(segments):
       s = seg['start'] / self.processing_sr
@@ -164,9 +445,15 @@ class SpeechExtractor(AudioProcessor):
 
       fade = min(self.fade_len_s, d / 2)
 
+      if self.chunk_seconds:
+        # low-memory: one seeked input per segment, so the graph never buffers the whole decode
+        input_args += ['-ss', str(s), '-t', str(d), '-i', str(audio_path)]
+        source = f'[{i}:a]'
+      else:
+        source = f'[0:a]atrim=start={s}:end={e},asetpts=PTS-STARTPTS,'
+
       trim = (
-        f'[0:a]atrim=start={s}:end={e},'
-        f'asetpts=PTS-STARTPTS,'
+        f'{source}'
         f'afade=t=in:st=0:d={fade},'
         f'afade=t=out:st={d-fade}:d={fade}'
         f'[a{i}];'
@@ -177,19 +464,82 @@ class SpeechExtractor(AudioProcessor):
     filter_concat = ''.join(filter_parts) + ''.join(concat_inputs) \
             + f'concat=n={len(segments)}:v=0:a=1[outa]'
 
+    if len(outputs) > 1:
+      labels = [f'[out{k}]' for k in range(len(outputs))]
+      filter_concat += f";[outa]asplit={len(outputs)}{''.join(labels)}"
+    else:
+      labels = ['[outa]']
+
     cmd = [
-      'ffmpeg', '-y', '-i', str(audio_path),
+      'ffmpeg', '-y', *self._ffmpeg_thread_args(), *(input_args or ['-i', str(audio_path)]),
       '-filter_complex', filter_concat,
-      '-map', '[outa]'
     ]
 
+    partials = []
+    attempt = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+    for label, (dest, codec_args) in zip(labels, outputs):
+      part = dest.with_name(f'{dest.stem}.part-{attempt}{dest.suffix}')
+      partials.append((part, dest))
+      cmd += ['-map', label, *codec_args]
+      if self.ffmpeg_threads:
+        cmd += ['-threads', str(self.ffmpeg_threads)]
+      cmd.append(str(part))
+
+    try:
+      with self._ffmpeg_timer('render'):
+        subprocess.run(cmd, check=True)
+    except BaseException:
+      for part, _ in partials:
+        part.unlink(missing_ok=True)
+      raise
+    for part, dest in partials:
+      os.replace(part, dest)
+      log.info(f'{dest} created')
+
+  @staticmethod
+  def _codec_args(ext: str, br: str | None = None) -> list[str]:
     if ext == '.mp3':
-      cmd += ['-c:a', 'libmp3lame', '-b:a', br]
+      return ['-c:a', 'libmp3lame', '-b:a', str(br)]
     elif ext == '.wav':
-      cmd += ['-c:a', 'pcm_s16le']
+      return ['-c:a', 'pcm_s16le']
     else:
-      cmd += ['-c:a', 'flac']
+      return ['-c:a', 'flac']
+
+  def _target_output(self, target: dict) -> tuple[Path, list[str]]:
+    '''Resolve one output target to its destination path and ffmpeg output options.'''
+    ext = '.' + str(target.get('format', '')).lower().lstrip('.')
+    if ext not in ('.mp3', '.wav', '.flac'):
+      raise ValueError(f"unsupported output format: {target.get('format')!r}")
+
+    is_mp3 = ext == '.mp3'
+    br = target.get('bitrate') or self.output_br
+    sr = target.get('sample_rate') or (self.output_sr if is_mp3 else None)
+    ch = target.get('channels') or (self.output_ch if is_mp3 else None)
+
+    args = self._codec_args(ext, br)
+    if sr:
+      args += ['-ar', str(sr)]
+    if ch:
+      args += ['-ac', str(ch)]
 
-    cmd.append(out_path)
-    subprocess.run(cmd, check=True)
-    log.info(f'{out_path} created')
+    root = settings.OUTPUT_DIR.resolve()
+    out_dir = (root / target.get('dir', '') / self._output_subdir()).resolve()
+    if not out_dir.is_relative_to(root):
+      raise ValueError(f"output target dir {target.get('dir')!r} escapes OUTPUT_DIR")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return out_dir / f'{self.source_audio_path.stem}_speech_only{ext}', args
+
+  def _output_subdir(self) -> Path:
+    '''
+    Relative location of the source under its INPUT_DIR, prefixed with that dir's name (and its
+    index when several INPUT_DIRs share a name), so equal stems from different folders do not
+    overwrite each other under OUTPUT_DIR. Sources outside every INPUT_DIR use their parent's name.
+    '''
+    src = self.source_audio_path.resolve()
+    input_dirs = [d.resolve() for d in settings.INPUT_DIR]
+    names = [d.name for d in input_dirs]
+    for i, d in enumerate(input_dirs):
+      if src.is_relative_to(d):
+        label = d.name if names.count(d.name) == 1 else f'{d.name}-{i}'
+        return Path(label or str(i)) / src.parent.relative_to(d)
+    return Path(src.parent.name)
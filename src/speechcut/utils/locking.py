@@ -1,6 +1,17 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import socket
+import time
+import uuid
 from pathlib import Path
-from threading import Lock
-from typing import Set
+from threading import Event, Lock, Thread
+from typing import Callable, Set
+
+from speechcut.config.settings import settings
+
+log = logging.getLogger('speechcut.locking')
 
 class ProcessingLock:
   '''
@@ -22,7 +33,231 @@ class ProcessingLock:
     with self._lock:
       self._locked_files.add(str(path.resolve()))
 
+  def try_lock(self, path: Path) -> bool:
+    '''Lock the file path unless it is already locked; return whether this call acquired it.'''
+    key = str(path.resolve())
+    with self._lock:
+      if key in self._locked_files:
+        return False
+      self._locked_files.add(key)
+      return True
+
   def unlock(self, path: Path) -> None:
     '''Unlock the file path after processing is done.'''
     with self._lock:
       self._locked_files.discard(str(path.resolve()))
+
+  def close(self) -> None:
+    '''Release everything held by this lock (no-op for the in-memory lock).'''
+
+class LeaseLock(ProcessingLock):
+  '''
+  Claims files across processes and hosts through lease files next to the source
+  (`<stem>_speech_only.lease`), for INPUT_DIRs on shared storage.
+
+  - A lease is created with O_CREAT|O_EXCL, so only one claimant wins.
+  - The holder rewrites its leases in place every `ttl / 3` seconds from a heartbeat thread,
+    through a handle to the file whose owner it has just checked, so a renewal can never land
+    in a lease another node has created since.
+  - A lease whose `expires` has passed belongs to a crashed or disconnected node: it is renamed
+    to a unique name and re-read there. The expiry check and the rename are not atomic, so if the
+    moved file turns out to be live (renewed, or already reclaimed by another node), it is put back
+    with O_EXCL and the claim is abandoned; otherwise it is deleted and claimed again.
+  - Release uses the same rename-then-verify step, so it only deletes the holder's own lease.
+
+  - When the heartbeat finds a lease gone or owned by another node (e.g. after a storage stall
+    longer than `ttl`), `on_lost(path)` is called so the caller can abort the local job.
+
+  Expiry compares wall clocks, so hosts sharing a directory need synchronized clocks (NTP)
+  with a skew well below `ttl`.
+  '''
+
+  def __init__(self, ttl: float = settings.LEASE_TTL_SECONDS, owner: str | None = None,
+               on_lost: Callable[[Path], None] | None = None):
+    super().__init__()
+    self.ttl = ttl
+    self.on_lost = on_lost
+    self.owner = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    self._leases: dict[str, Path] = {}
+    self._stop = Event()
+    self._heartbeat = Thread(target=self._heartbeat_loop, name='lease-heartbeat', daemon=True)
+    self._heartbeat.start()
+
+  @staticmethod
+  def lease_path(path: Path) -> Path:
+    return path.with_name(f'{path.stem}_speech_only.lease')
+
+  def _payload(self) -> bytes:
+    now = time.time()
+    return json.dumps({'owner': self.owner, 'renewed': now, 'expires': now + self.ttl}).encode('utf-8')
+
+  @staticmethod
+  def _read(lease: Path) -> dict | None:
+    try:
+      return json.loads(lease.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+      return None
+
+  def _expired(self, lease: Path) -> bool:
+    data = self._read(lease)
+    if data is None:
+      # unreadable: a half-written lease from a crashed node, judged by its age
+      try:
+        return time.time() - lease.stat().st_mtime > self.ttl
+      except OSError:
+        return False
+    return time.time() > float(data.get('expires', 0))
+
+  def _create(self, lease: Path, payload: bytes | None = None) -> bool:
+    try:
+      fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+      return False
+    try:
+      os.write(fd, payload if payload is not None else self._payload())
+    finally:
+      os.close(fd)
+    return True
+
+  @staticmethod
+  def _take(lease: Path, tag: str) -> Path | None:
+    '''Rename `lease` to a unique private name; None if it is gone (or cannot be moved).'''
+    taken = lease.with_name(f'{lease.name}.{tag}-{uuid.uuid4().hex[:8]}')
+    try:
+      os.rename(lease, taken)
+    except FileNotFoundError:
+      return None
+    except OSError as e:
+      log.warning(f'[lease] cannot move {lease.name}: {e}')
+      return None
+    return taken
+
+  def _put_back(self, taken: Path, lease: Path) -> None:
+    '''Restore a lease moved by `_take` without overwriting one created in the meantime.'''
+    try:
+      os.link(taken, lease)  # keeps the inode, so an in-flight renewal by the holder is not lost
+      restored = True
+    except FileExistsError:
+      restored = False
+    except OSError:
+      # no hard links on this filesystem: copy with O_EXCL instead
+      try:
+        restored = self._create(lease, taken.read_bytes())
+      except OSError as e:
+        log.error(f'[lease] cannot restore {lease.name}: {e}')
+        taken.unlink(missing_ok=True)
+        return
+    if not restored:
+      log.error(f'[lease] {lease.name} was claimed while moved aside; its previous holder will see it as lost')
+    taken.unlink(missing_ok=True)
+
+  def _reclaim(self, lease: Path) -> bool:
+    '''Move an expired lease out of the way; False if it was live after all or another node got there first.'''
+    stale = self._take(lease, 'stale')
+    if stale is None:
+      return False
+    # the lease may have been renewed, or replaced by another reclaimer, since we judged it expired
+    if not self._expired(stale):
+      log.info(f'[lease] {lease.name} is live ({self._read(stale)}); giving up the claim')
+      self._put_back(stale, lease)
+      return False
+    log.warning(f'[lease] reclaimed expired lease {lease.name} ({self._read(stale)})')
+    stale.unlink(missing_ok=True)
+    return True
+
+  def is_locked(self, path: Path) -> bool:
+    '''Locked here, or leased by a live claimant anywhere.'''
+    if super().is_locked(path):
+      return True
+    lease = self.lease_path(path)
+    return lease.exists() and not self._expired(lease)
+
+  def lock(self, path: Path) -> None:
+    if not self.try_lock(path):
+      raise RuntimeError(f'{path} is leased by another claimant')
+
+  def try_lock(self, path: Path) -> bool:
+    if not super().try_lock(path):
+      return False
+    lease = self.lease_path(path)
+    try:
+      acquired = self._create(lease) or (self._expired(lease) and self._reclaim(lease) and self._create(lease))
+    except OSError as e:
+      log.error(f'[lease] cannot create {lease}: {e}')
+      acquired = False
+    if not acquired:
+      super().unlock(path)
+      return False
+    with self._lock:
+      self._leases[str(path.resolve())] = lease
+    return True
+
+  def unlock(self, path: Path) -> None:
+    with self._lock:
+      lease = self._leases.pop(str(path.resolve()), None)
+    if lease is not None:
+      taken = self._take(lease, 'release')
+      if taken is not None:
+        data = self._read(taken)
+        if data is not None and data.get('owner') == self.owner:
+          taken.unlink(missing_ok=True)
+        else:
+          log.warning(f'[lease] {lease.name} is no longer ours ({data}); leaving it')
+          self._put_back(taken, lease)
+    super().unlock(path)
+
+  def _renew(self) -> None:
+    with self._lock:
+      held = list(self._leases.items())
+    for key, lease in held:
+      try:
+        renewed = self._renew_one(lease)
+      except OSError as e:
+        log.warning(f'[lease] renew failed for {lease.name}: {e}')
+        continue
+      if not renewed:
+        log.error(f'[lease] lost lease {lease.name}; another node may process {Path(key).name}')
+        with self._lock:
+          self._leases.pop(key, None)
+        if self.on_lost is not None:
+          try:
+            self.on_lost(Path(key))
+          except Exception:
+            log.exception(f'[lease] on_lost failed for {Path(key).name}')
+
+  def _renew_one(self, lease: Path) -> bool:
+    '''
+    Rewrite `lease` if we still own it; False if it is gone or owned by someone else.
+    The owner check and the write go through one handle, so the write lands in the file that was
+    checked even if another node replaces the lease in between (readers of a half-written lease
+    fall back to its fresh mtime).
+    '''
+    try:
+      fd = os.open(lease, os.O_RDWR)
+    except FileNotFoundError:
+      return False
+    try:
+      try:
+        data = json.loads(os.read(fd, 64 * 1024).decode('utf-8'))
+      except ValueError:
+        return False
+      if data.get('owner') != self.owner:
+        return False
+      payload = self._payload()
+      os.lseek(fd, 0, os.SEEK_SET)
+      os.write(fd, payload)
+      os.ftruncate(fd, len(payload))
+    finally:
+      os.close(fd)
+    return True
+
+  def _heartbeat_loop(self) -> None:
+    while not self._stop.wait(self.ttl / 3):
+      self._renew()
+
+  def close(self) -> None:
+    self._stop.set()
+    with self._lock:
+      keys = list(self._leases)
+    for key in keys:
+      self.unlock(Path(key))
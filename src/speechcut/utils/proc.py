@@ -0,0 +1,65 @@
+from __future__ import annotations
+import os
+
+def rss_bytes(pid: int | None = None) -> int:
+  '''
+  Resident set size of `pid` (default: this process) in bytes; 0 if it cannot be determined.
+  Uses psutil when installed, /proc on Linux, and the peak RSS from `resource` as a last resort.
+  '''
+  pid = pid or os.getpid()
+  try:
+    import psutil
+    return int(psutil.Process(pid).memory_info().rss)
+  except ImportError:
+    pass
+  except Exception:
+    return 0
+
+  try:
+    with open(f'/proc/{pid}/statm', encoding='ascii') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError, IndexError):
+    pass
+
+  if pid == os.getpid():
+    try:
+      import resource
+      return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+    except ImportError:
+      pass
+  return 0
+
+def child_pids(pid: int) -> list[int]:
+  '''
+  PIDs of all descendants of `pid` (e.g. ffmpeg started by a worker); empty if they cannot be listed.
+  Uses psutil when installed and /proc on Linux.
+  '''
+  try:
+    import psutil
+    return [c.pid for c in psutil.Process(pid).children(recursive=True)]
+  except ImportError:
+    pass
+  except Exception:
+    return []
+
+  parents: dict[int, int] = {}
+  try:
+    entries = os.listdir('/proc')
+  except OSError:
+    return []
+  for name in entries:
+    if not name.isdigit():
+      continue
+    try:
+      with open(f'/proc/{name}/stat', encoding='ascii', errors='replace') as f:
+        # the command name may contain spaces/parens; ppid is the 2nd field after the last ')'
+        parents[int(name)] = int(f.read().rsplit(')', 1)[1].split()[1])
+    except (OSError, ValueError, IndexError):
+      continue
+  found, frontier = [], [pid]
+  while frontier:
+    p = frontier.pop()
+    kids = [c for c, pp in parents.items() if pp == p]
+    found += kids
+    frontier += kids
+  return found
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import cProfile
+import fnmatch
+import io
+import logging
+import os
+import pstats
+import re
+from datetime import datetime
+from pathlib import Path
+
+from speechcut.config.settings import settings
+
+log = logging.getLogger('speechcut.profiling')
+PROFILE_PATTERN = re.compile(r'__profile', re.IGNORECASE)
+
+def should_profile(audio_path: str) -> bool:
+  '''Profile a job if the filename contains `__profile`, PROFILE_ALL is set, or it matches PROFILE_PATTERNS.'''
+  basename = os.path.basename(audio_path)
+  if settings.PROFILE_ALL or PROFILE_PATTERN.search(basename):
+    return True
+  return any(fnmatch.fnmatch(basename.lower(), p.lower()) for p in settings.PROFILE_PATTERNS)
+
+def write_profile(
+  profiler: cProfile.Profile,
+  audio_path: str,
+  extra: dict[str, dict[str, float]] | None = None,
+  out_dir: Path | None = None,
+  top_n: int = settings.PROFILE_TOP_N,
+) -> Path:
+  '''
+  Write `<stem>-<timestamp>.prof` (pstats/snakeviz/gprof2dot input) and a `.txt` summary with
+  the `extra` timing tables (e.g. stage and ffmpeg wall times) and the top-N functions by cumulative time.
+  Returns the `.prof` path.
+  '''
+  out_dir = out_dir or settings.PROFILE_DIR
+  out_dir.mkdir(parents=True, exist_ok=True)
+  base = out_dir / f'{Path(audio_path).stem}-{datetime.now():%Y%m%d-%H%M%S}'
+  prof_path = base.with_name(base.name + '.prof')  # not with_suffix: stems may contain dots
+  profiler.dump_stats(str(prof_path))
+
+  buf = io.StringIO()
+  buf.write(f'job: {audio_path}\n')
+  for title, table in (extra or {}).items():
+    buf.write(f'\n[{title}]\n')
+    for name, sec in sorted(table.items(), key=lambda kv: -kv[1]):
+      buf.write(f'  {name:<16} {sec:10.3f}s\n')
+  buf.write(f'\n[top {top_n} by cumulative time]\n')
+  pstats.Stats(profiler, stream=buf).sort_stats('cumulative').print_stats(top_n)
+  base.with_name(base.name + '.txt').write_text(buf.getvalue(), encoding='utf-8')
+
+  log.info(f'[profile] {prof_path}')
+  return prof_path
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger('speechcut.threads')
+
+THREAD_ENV_VARS = (
+  'OMP_NUM_THREADS',
+  'MKL_NUM_THREADS',
+  'OPENBLAS_NUM_THREADS',
+  'TF_NUM_INTRAOP_THREADS',
+)
+
+def available_cpus() -> list[int]:
+  '''CPUs this process may run on (respects an affinity mask set by the OS or a container).'''
+  if hasattr(os, 'sched_getaffinity'):
+    return sorted(os.sched_getaffinity(0))
+  return list(range(os.cpu_count() or 1))
+
+def plan_cpu_sets(n_workers: int, threads: int = 0) -> list[tuple[list[int], int]]:
+  '''
+  Split the available CPUs into `n_workers` disjoint, contiguous sets.
+  Returns `(cpus, threads)` per worker; `threads=0` means one thread per CPU in the set.
+  With more workers than CPUs, sets wrap around and share CPUs.
+  '''
+  cpus = available_cpus()
+  n_workers = max(1, n_workers)
+  per = max(1, len(cpus) // n_workers)
+  layout = []
+  for i in range(n_workers):
+    start = (i * per) % len(cpus)
+    cpu_set = cpus[start:start + per] or cpus[:per]
+    layout.append((cpu_set, threads or len(cpu_set)))
+  return layout
+
+def _pin(cpus: list[int]) -> None:
+  if hasattr(os, 'sched_setaffinity'):
+    os.sched_setaffinity(0, cpus)
+    return
+  try:
+    import psutil  # optional; provides affinity on Windows
+  except ImportError:
+    log.warning('[threads] CPU pinning needs os.sched_setaffinity or psutil; skipped')
+    return
+  psutil.Process().cpu_affinity(cpus)
+
+_env_lock = threading.Lock()
+
+@contextmanager
+def thread_env(threads: int):
+  '''
+  Temporarily export the thread-count variables for `threads` in this process, so that a worker
+  spawned inside the block inherits them. The native pools (OpenBLAS via numpy, MKL, OpenMP) read
+  them once when their library is loaded, which in a spawn child happens while the parent's main
+  module is re-imported, before `Process.run()` starts. The lock keeps concurrent supervisors with
+  different budgets from seeing each other's values.
+  '''
+  if threads <= 0:
+    yield
+    return
+  names = THREAD_ENV_VARS + ('TF_NUM_INTEROP_THREADS',)
+  with _env_lock:
+    saved = {name: os.environ.get(name) for name in names}
+    try:
+      for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+      os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+      yield
+    finally:
+      for name, value in saved.items():
+        if value is None:
+          os.environ.pop(name, None)
+        else:
+          os.environ[name] = value
+
+def apply_thread_budget(threads: int, cpus: list[int] | None = None, pin: bool = False) -> None:
+  '''
+  Limit the calling process (a worker) to `threads` compute threads.
+  Must run before the models are loaded: TensorFlow only accepts threading options
+  before its runtime is initialized, and torch inter-op threads before the first parallel op.
+  The environment variables set here only reach libraries loaded afterwards; start the worker
+  inside `thread_env` so that they also apply to libraries imported during unpickling.
+  '''
+  if threads <= 0:
+    return
+  for name in THREAD_ENV_VARS:
+    os.environ[name] = str(threads)
+  # inter-op parallelism only helps with independent graph branches; keep it small
+  os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+
+  if pin and cpus:
+    _pin(cpus)
+
+  try:
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+  except (ImportError, RuntimeError) as e:
+    log.warning(f'[threads] torch thread budget not applied: {e}')
+
+  try:
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+  except (ImportError, RuntimeError) as e:
+    log.warning(f'[threads] TensorFlow thread budget not applied: {e}')
+
+  log.info(f'[threads] budget={threads} cpus={cpus if pin else "unpinned"}')
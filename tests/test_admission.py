@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+
+from speechcut.app import admission
+from speechcut.app.admission import MemoryBudget, plan_job
+
+GiB = 1024 ** 3
+
+def test_budget_defers_a_job_that_does_not_fit():
+  budget = MemoryBudget(4 * GiB)
+  assert budget.try_acquire(Path('a.mp3'), 3 * GiB)
+  assert not budget.try_acquire(Path('b.mp3'), 2 * GiB)
+  budget.release(Path('a.mp3'))
+  assert budget.try_acquire(Path('b.mp3'), 2 * GiB)
+
+def test_oversized_job_is_admitted_when_nothing_runs():
+  budget = MemoryBudget(1 * GiB)
+  assert budget.try_acquire(Path('huge.wav'), 8 * GiB)
+
+def test_standby_reservation_does_not_keep_the_next_job_out():
+  # regression: a standby reservation made `_reserved` non-empty, so a job that fits the
+  # ceiling on its own but not next to the standby was deferred forever with nothing running
+  budget = MemoryBudget(4 * GiB)
+  assert budget.try_acquire('standby-worker-0', int(1.5 * GiB))
+  assert budget.try_acquire(Path('long.wav'), int(3.07 * GiB))
+  assert budget.used == int(1.5 * GiB) + int(3.07 * GiB)
+
+def test_standby_waits_while_jobs_fill_the_budget():
+  budget = MemoryBudget(4 * GiB)
+  assert budget.try_acquire(Path('a.mp3'), 3 * GiB)
+  assert not budget.try_acquire('standby-worker-0', int(1.5 * GiB))
+  budget.release(Path('a.mp3'))
+  assert budget.try_acquire('standby-worker-0', int(1.5 * GiB))
+
+@pytest.fixture
+def probe(monkeypatch, tmp_path):
+  def make(duration, size=1024, sample_rate=44100, channels=2):
+    path = tmp_path / 'rec.wav'
+    with open(path, 'wb') as f:
+      f.truncate(size)  # sparse
+    info = {'duration': duration, 'sample_rate': sample_rate, 'channels': channels}
+    monkeypatch.setattr(admission.AudioProcessor, 'get_audio_info', lambda self: info)
+    return path
+  return make
+
+def test_plan_runs_a_file_in_full_when_the_estimate_fits(probe):
+  plan = plan_job(probe(90 * 60), ceiling=4 * GiB)
+  assert not plan.low_memory
+  assert plan.estimated_bytes < 4 * GiB
+
+def test_plan_ignores_the_file_size(probe):
+  # a 1-hour 44.1 kHz stereo WAV is ~635MB on disk, well above MAX_AUDIO_BYTES
+  plan = plan_job(probe(3600, size=635 * 1024 * 1024), ceiling=4 * GiB)
+  assert not plan.low_memory
+
+def test_plan_falls_back_to_chunks_when_the_estimate_does_not_fit(probe):
+  plan = plan_job(probe(4 * 3600), ceiling=4 * GiB)
+  assert plan.low_memory
+
+def test_live_plan_does_not_probe(monkeypatch, tmp_path):
+  # a recording that was just created has no readable duration yet (ffprobe reports N/A)
+  def fail(self):
+    raise ValueError("could not convert string to float: 'N/A'")
+  monkeypatch.setattr(admission.AudioProcessor, 'get_audio_info', fail)
+  path = tmp_path / 'live.mp3'
+  path.write_bytes(b'ID3')
+  plan = plan_job(path, live=True)
+  assert plan.live and plan.low_memory
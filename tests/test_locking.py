@@ -0,0 +1,135 @@
+import json
+import time
+
+import pytest
+
+from speechcut.utils.locking import LeaseLock
+
+@pytest.fixture
+def src(tmp_path):
+  p = tmp_path / 'talk.mp3'
+  p.write_bytes(b'')
+  return p
+
+@pytest.fixture
+def nodes():
+  # long ttl: the heartbeat thread stays out of the way, tests call `_renew` themselves
+  made = []
+  def make(name):
+    lock = LeaseLock(ttl=3600, owner=name)
+    made.append(lock)
+    return lock
+  yield make
+  for lock in made:
+    lock._stop.set()
+
+def _owner(src):
+  return json.loads(LeaseLock.lease_path(src).read_text(encoding='utf-8'))['owner']
+
+def _expire(src):
+  lease = LeaseLock.lease_path(src)
+  data = json.loads(lease.read_text(encoding='utf-8'))
+  data['expires'] = time.time() - 1
+  lease.write_text(json.dumps(data), encoding='utf-8')
+
+def _leftovers(src):
+  return sorted(p.name for p in src.parent.iterdir() if '.lease.' in p.name)
+
+def test_lease_is_exclusive_and_released(src, nodes):
+  a, b = nodes('a'), nodes('b')
+  assert a.try_lock(src)
+  assert not b.try_lock(src)
+  assert b.is_locked(src)
+  a.unlock(src)
+  assert not LeaseLock.lease_path(src).exists()
+  assert b.try_lock(src)
+
+def test_expired_lease_is_reclaimed(src, nodes):
+  a, b = nodes('a'), nodes('b')
+  assert a.try_lock(src)
+  _expire(src)
+  assert b.try_lock(src)
+  assert _owner(src) == 'b'
+  assert _leftovers(src) == []
+
+def test_late_reclaimer_gives_up_a_lease_already_reclaimed(src, nodes):
+  # b and c both saw a's lease expired; b reclaimed it first
+  a, b, c = nodes('a'), nodes('b'), nodes('c')
+  assert a.try_lock(src)
+  _expire(src)
+  assert b.try_lock(src)
+  assert not c._reclaim(LeaseLock.lease_path(src))
+  assert _owner(src) == 'b'
+  assert _leftovers(src) == []
+
+def test_reclaim_gives_up_a_lease_renewed_after_the_check(src, nodes):
+  a, b = nodes('a'), nodes('b')
+  assert a.try_lock(src)
+  _expire(src)
+  a._renew()  # lands between b's expiry check and its rename
+  assert not b._reclaim(LeaseLock.lease_path(src))
+  assert _owner(src) == 'a'
+  a._renew()
+  assert str(src.resolve()) in a._leases
+
+def test_renew_does_not_overwrite_a_reclaimed_lease(src, nodes):
+  a, b = nodes('a'), nodes('b')
+  assert a.try_lock(src)
+  _expire(src)
+  assert b.try_lock(src)
+  a._renew()
+  assert _owner(src) == 'b'
+  assert str(src.resolve()) not in a._leases
+
+def test_unlock_does_not_delete_a_reclaimed_lease(src, nodes):
+  a, b = nodes('a'), nodes('b')
+  assert a.try_lock(src)
+  _expire(src)
+  assert b.try_lock(src)
+  a.unlock(src)
+  assert _owner(src) == 'b'
+  assert _leftovers(src) == []
+
+def test_renew_interleaved_with_reclaim_keeps_the_new_lease(src, nodes):
+  a, b = nodes('a'), nodes('b')
+  assert a.try_lock(src)
+  payload = a._payload
+  def reclaim_then_payload():
+    # b reclaims after a checked ownership, before a writes
+    _expire(src)
+    assert b.try_lock(src)
+    return payload()
+  a._payload = reclaim_then_payload
+  a._renew()
+  assert _owner(src) == 'b'
+
+def test_unlock_interleaved_with_reclaim_keeps_the_new_lease(src, nodes):
+  a, b = nodes('a'), nodes('b')
+  assert a.try_lock(src)
+  read = LeaseLock._read
+  def read_then_reclaim(lease):
+    # b claims the file after a checked ownership, before a deletes anything
+    data = read(lease)
+    if LeaseLock.lease_path(src).exists():
+      _expire(src)
+    assert b.try_lock(src)
+    return data
+  a._read = read_then_reclaim
+  a.unlock(src)
+  assert _owner(src) == 'b'
+
+def test_lost_lease_is_reported(src):
+  lost = []
+  a = LeaseLock(ttl=3600, owner='a', on_lost=lost.append)
+  b = LeaseLock(ttl=3600, owner='b')
+  try:
+    assert a.try_lock(src)
+    _expire(src)
+    assert b.try_lock(src)
+    a._renew()
+    assert lost == [src.resolve()]
+    a._renew()
+    assert lost == [src.resolve()]  # reported once
+  finally:
+    a._stop.set()
+    b._stop.set()
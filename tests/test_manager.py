@@ -0,0 +1,137 @@
+import queue
+import threading
+from pathlib import Path
+
+import pytest
+
+from speechcut.app import manager as manager_mod
+from speechcut.app.admission import MemoryBudget
+from speechcut.app.metrics import metrics
+
+MiB = 1024 ** 2
+
+class FakeWorker:
+  '''Thread standing in for WorkerProcess: reports ready with `rss`, answers every task with done.'''
+  started = 0
+
+  def __init__(self, task_queue, result_queue, **kwargs):
+    self.task_queue, self.result_queue = task_queue, result_queue
+    FakeWorker.started += 1
+    self.pid = FakeWorker.started
+    self.alive = False
+
+  def start(self):
+    self.alive = True
+    threading.Thread(target=self._run, daemon=True).start()
+
+  def _run(self):
+    self.result_queue.put({'type': 'ready', 'rss': 100 * MiB, 'load_seconds': 0.0})
+    while True:
+      msg = self.task_queue.get()
+      if msg['type'] == 'shutdown':
+        self.alive = False
+        return
+      if msg['path'].endswith('hang.mp3'):
+        continue  # never answers, like a job stuck in a long render
+      self.result_queue.put({'type': 'done', 'id': msg['id'], 'rss': 100 * MiB})
+
+  def is_alive(self):
+    return self.alive
+
+  def join(self, timeout=None):
+    pass
+
+  def terminate(self):
+    self.alive = False
+
+class _Queue(queue.Queue):
+  def close(self):
+    pass
+
+class _Context:
+  def Queue(self):
+    return _Queue()
+
+@pytest.fixture
+def supervisor(monkeypatch):
+  monkeypatch.setattr(manager_mod, 'WorkerProcess', FakeWorker)
+  made = []
+  def make(**kwargs):
+    s = manager_mod.Supervisor(default_timeout=5, **kwargs)
+    s.ctx = _Context()
+    s._make_queues()
+    assert s.warm_up()
+    made.append(s)
+    return s
+  yield make
+  for s in made:
+    s.shutdown()
+
+def _recycles(worker_id):
+  for line in metrics.render().splitlines():
+    if line.startswith(f'speechcut_worker_recycles_total{{worker="{worker_id}"}}'):
+      return float(line.split()[-1])
+  return 0.0
+
+def _wait_ready(s):
+  # FakeWorker reports ready immediately; give its thread a moment
+  worker, _, result_queue = s._standby
+  msg = result_queue.get(timeout=5)
+  result_queue.put(msg)
+
+def test_standby_is_deferred_while_the_budget_is_full(supervisor):
+  budget = MemoryBudget(250 * MiB)
+  s = supervisor(max_tasks=1, budget=budget, worker_id=10)
+  budget.try_acquire(Path('running.mp3'), 200 * MiB)
+  assert s.process('a.mp3') == 'ok'
+  assert s._standby is None
+  assert budget.used == 200 * MiB
+
+  budget.release(Path('running.mp3'))
+  assert s.process('b.mp3') == 'ok'  # the standby starts before b; b still runs on the old worker
+  assert budget.used == 100 * MiB
+
+def test_promotion_releases_the_standby_reservation_and_counts_a_recycle(supervisor):
+  budget = MemoryBudget(1024 * MiB)
+  s = supervisor(max_tasks=1, budget=budget, worker_id=11)
+  assert s.process('a.mp3') == 'ok'
+  old_pid = s.worker.pid
+  _wait_ready(s)
+  s._swap_if_standby_ready()
+  assert s.worker.pid != old_pid
+  assert _recycles(11) == 1
+  assert budget.used == 0
+
+def test_replacing_a_dead_worker_is_not_a_recycle(supervisor):
+  budget = MemoryBudget(1024 * MiB)
+  s = supervisor(max_tasks=1, budget=budget, worker_id=12)
+  assert s.process('a.mp3') == 'ok'
+  _wait_ready(s)
+  s._kill_worker()  # e.g. a timeout while the standby was loading
+  assert s.process('b.mp3') == 'ok'
+  assert _recycles(12) == 0
+
+def test_standby_reservation_does_not_stall_the_next_job(supervisor):
+  # regression: with the standby reserved, a job that fits the ceiling on its own was deferred
+  # forever even though nothing was running, so process() was never called to promote it
+  budget = MemoryBudget(4096 * MiB)
+  s = supervisor(max_tasks=1, budget=budget, worker_id=13)
+  s._model_bytes = 1536 * MiB
+  assert s.process('a.mp3') == 'ok'
+  assert s._standby is not None
+  assert budget.try_acquire(Path('long.wav'), 3144 * MiB)
+  assert s.process('long.wav') == 'ok'
+  budget.release(Path('long.wav'))
+
+def test_abort_stops_the_job_in_progress(supervisor):
+  s = supervisor(worker_id=14)
+  timer = threading.Timer(0.2, s.abort, args=(Path('hang.mp3'),))
+  timer.start()
+  assert s.process('hang.mp3', timeout=30) == 'aborted'
+  assert s.worker is None
+  assert s.process('next.mp3') == 'ok'
+
+def test_abort_ignores_other_files(supervisor):
+  s = supervisor(worker_id=15)
+  s.abort(Path('a.mp3'))
+  assert s.process('a.mp3') == 'ok'
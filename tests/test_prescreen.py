@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from speechcut.ml.classifier.prescreen import SpectralPrescreen
+
+SR = 16000
+T = np.arange(SR * 8) / SR
+
+@pytest.fixture
+def prescreen():
+  return SpectralPrescreen(sr=SR, min_seconds=0)
+
+def _speech_like():
+  # 4 Hz syllable envelope alternating voiced buzz and unvoiced noise
+  rng = np.random.default_rng(0)
+  syllables = (np.sin(2 * np.pi * 4 * T) > 0).astype(float)
+  voiced = np.sign(np.sin(2 * np.pi * 120 * T)) * 0.3
+  unvoiced = rng.normal(0, 0.3, len(T))
+  return syllables * np.where(np.sin(2 * np.pi * 2 * T) > 0, voiced, unvoiced)
+
+def test_tonal_music_is_resolved_as_music(prescreen):
+  chord = sum(np.sin(2 * np.pi * f * T) for f in (220, 330, 440)) * 0.2
+  assert prescreen.decide(chord)[0] == 'Music'
+
+def test_speech_like_signal_is_resolved_as_speech(prescreen):
+  assert prescreen.decide(_speech_like())[0] == 'Speech'
+
+@pytest.mark.parametrize('waveform', [
+  np.random.default_rng(1).normal(0, 0.3, len(T)),  # white noise / static
+  np.zeros(len(T)),                                  # digital silence
+])
+def test_non_tonal_non_speech_goes_to_yamnet(prescreen, waveform):
+  assert prescreen.decide(waveform)[0] is None
+
+@pytest.mark.parametrize('n', [0, 1, 100, 399])
+def test_segments_shorter_than_two_frames_are_ambiguous(prescreen, n):
+  assert prescreen.features(np.ones(n)) is None
+  assert prescreen.decide(np.ones(n)) == (None, 0.5)